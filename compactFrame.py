@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Shrinks a freshly loaded dataFrame so that large merged exports fit in
+memory: drops the columns a viewer never reads, stores the filtered and
+plotted measures (FLOAT32COLUMNS) as float32, and stores the repeated label
+columns as categoricals. Masses, m/z, retention times and intensities need
+more than float32's ~7 significant digits and are always kept as float64. The frame is changed in place (dtypes one
+column at a time), so compacting never holds a second copy of the whole
+frame; dropping columns only copies the ones kept.
+
+qMS.readIsoCSV and mrmTools.readMRMCSV derive columns from the raw csv while
+they read it, so the compaction is applied to their result rather than
+through read_csv itself. Only the MRM viewer gets a column whitelist: the
+_iso_res.csv viewers (masse.py, masseESIGroup.py) write the whole frame back
+out as the _filt.csv that downstream scripts read, and qMS adds columns from
+fields that can't be listed here, so dropping any of them would silently
+change what gets exported.
+"""
+
+import numpy
+import pandas
+
+#string columns with a handful of distinct values repeated on every row
+CATEGORYCOLUMNS = ['protein', 'Protein', 'shortName', 'Replicate Name', 'TID', 'PID']
+
+#measures only ever compared against filter limits or plotted, where float32's
+#~7 significant digits are far below their noise; compacted exports carry
+#them at that precision
+FLOAT32COLUMNS = ['ppmDiff', 'ppm_n14', 'ppm_n15', 'rtDiff', 'resid', 'ratio', 'GW', 'FRC_NX',
+                  'currentCalc', 'PPMtranLH', 'PPMtranTRANALL', 'RTdsLH', 'RTdsTRANALL']
+
+def fitsFloat32(values):
+    """
+    True if no finite value of values is out of float32's range.
+    """
+    finite = values[numpy.isfinite(values)]
+    return len(finite) == 0 or numpy.abs(finite).max() <= numpy.finfo(numpy.float32).max
+
+def compactFrame(dataFrame, keep=None, categories=CATEGORYCOLUMNS, floats=FLOAT32COLUMNS):
+    """
+    Compacts dataFrame in place and returns it. keep is a whitelist of the
+    columns to retain (None keeps them all; names not in dataFrame are
+    ignored). Only the float64 columns in floats become float32.
+    """
+    if keep is not None:
+        keep = set(keep)
+        dataFrame.drop([c for c in dataFrame.columns if not c in keep], axis=1, inplace=True)
+    for col in list(dataFrame.columns):
+        values = dataFrame[col].values
+        if col in categories and values.dtype == object:
+            dataFrame[col] = dataFrame[col].astype('category')
+        elif col in floats and values.dtype == numpy.float64 and fitsFloat32(values):
+            dataFrame[col] = values.astype(numpy.float32)
+    return dataFrame
+
+def compactLoaded(dataFrame, keep=None):
+    """
+    compactFrame for the viewers' openFile, reporting the memory saved.
+    """
+    before = frameBytes(dataFrame)
+    compactFrame(dataFrame, keep=keep)
+    print "compacted from " + str(before/2**20) + " to " + str(frameBytes(dataFrame)/2**20) + " MB"
+    return dataFrame
+
+def frameBytes(dataFrame):
+    return int(dataFrame.memory_usage(index=True, deep=True).sum())
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Times the masse pass mask on a synthetic dataFrame: the original chained
+pandas comparisons against masseFilter.fusedMask with numexpr (if it is
+installed) and with the numpy kernel. Checks that all of them agree; run it
+on the target machine before setting masseFilter.NUMEXPRMINROWS.
+
+usage : python filterBenchmark.py [rows] [repeats]
+"""
+
+import sys
+import time
+import numpy
+import pandas
+import masseFilter
+
+def syntheticFrame(rows, seed=0):
+    rs = numpy.random.RandomState(seed)
+    df = pandas.DataFrame({'ppmDiff':rs.normal(0, 10, rows),
+                           'ppm_n14':rs.normal(0, 10, rows),
+                           'ppm_n15':rs.normal(0, 10, rows),
+                           'missed':rs.randint(0, 4, rows).astype(float),
+                           'rtDiff':rs.normal(0, 0.5, rows),
+                           'resid':rs.exponential(0.01, rows),
+                           'ratio':rs.lognormal(0, 1, rows),
+                           'GW':rs.normal(1, 0.2, rows),
+                           'minIntensity':rs.lognormal(8, 1, rows),
+                           'FRC_NX':rs.rand(rows),
+                           'handSave':rs.rand(rows) < 0.01,
+                           'handDelete':rs.rand(rows) < 0.01})
+    #a sprinkling of failed fits
+    df.loc[rs.rand(rows) < 0.02, 'resid'] = numpy.nan
+    return df
+
+def syntheticSpec():
+    spec = {'ranges':{'ppmDiff':[-5, 5], 'ppm_n14':[-15, 15], 'ppm_n15':[-15, 15],
+                      'missed':[0, 1], 'rtDiff':[-0.5, 0.5], 'resid':[0, 0.02],
+                      'ratio':[0.05, 20], 'GW':[0.6, 1.4],
+                      'minIntensity':[500, numpy.inf], 'FRC_NX':[0.1, 0.9]},
+            'handSave':True, 'handDelete':True}
+    spec['active'] = [col for (col, low, high, key) in masseFilter.FILTERPARAMS]
+    return spec
+
+def timeIt(f, repeats):
+    best = None
+    for i in range(repeats):
+        start = time.time()
+        mask = f()
+        t = time.time()-start
+        if best is None or t < best:
+            best = t
+    return [best, mask]
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    df = syntheticFrame(rows)
+    spec = syntheticSpec()
+    steps = masseFilter.passSteps(spec)
+    runs = [('chained pandas', lambda: masseFilter.chainedPassMask(df, spec)),
+            ('fused numpy', lambda: masseFilter.fusedMask(df, steps, useNumexpr=False))]
+    if masseFilter.numexpr is not None:
+        runs.append(('fused numexpr', lambda: masseFilter.fusedMask(df, steps, useNumexpr=True)))
+    else:
+        print 'numexpr not installed, skipping it'
+    print str(rows) + ' rows, best of ' + str(repeats)
+    reference = None
+    for (name, f) in runs:
+        [t, mask] = timeIt(f, repeats)
+        if reference is None:
+            [reference, base] = [mask, t]
+        agrees = (mask == reference).all()
+        print '\t%-16s %8.2f ms  x%.1f  %s' % (name, t*1000, base/t, 'ok' if agrees else 'MASKS DIFFER')
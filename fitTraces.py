@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+Loading of the per-peptide fit traces (<isofile>.plots and <isofile>.txt)
+shown in the right hand panel of the masse viewers.
+
+The traces of a dataset can be packed into a single archive so the viewers
+don't have to open two small files per peptide:
+
+usage : python fitTraces.py /path/to/dataset/
+"""
+
+import os
+import csv
+import sys
+import glob
+import threading
+import collections
+import numpy
+import pandas
+
+ARCHIVENAME = 'fitTraces'
+TRACEFIELDS = ['mz', 'dat', 'fit', 'resid']
+
+def readFitTrace(datapath, isofile):
+    """
+    Returns {'mz', 'dat', 'fit', 'resid'} numpy arrays for a single fit.
+    """
+    df = pandas.read_csv(os.path.join(datapath, isofile+'.plots'))
+    df2 = pandas.read_csv(os.path.join(datapath, isofile+'.txt'), header=None, sep=' ')
+    return {'mz':df2[0].values[0:len(df['dat'])],
+            'dat':df['dat'].values,
+            'fit':df['fit'].values,
+            'resid':df['resid'].values}
+
+class FitTraceArchive(object):
+    """
+    Read side of a packed archive: <ARCHIVENAME>.bin holds the float64 arrays
+    of every trace back to back (mz, dat, fit, resid; length points each) and
+    <ARCHIVENAME>.idx is a csv of isofile, offset, length and the size/mtime
+    of the .plots and .txt files each trace was packed from. The .bin is
+    memory mapped, so only the traces that are read get paged in. The files
+    are checked once, when the archive is opened: traces whose files changed
+    since packing are dropped from the index, so re-fitted peptides are read
+    from the new files, and lookups never touch the files again.
+    """
+    def __init__(self, datapath):
+        self.datapath = datapath
+        self.index = {}
+        f = open(os.path.join(datapath, ARCHIVENAME+'.idx'), 'r')
+        r = csv.reader(f)
+        r.next()
+        for l in r:
+            #archives packed before the stamps were stored are never trusted
+            if isCurrent(datapath, l[0], l[3:]):
+                self.index[l[0]] = (int(l[1]), int(l[2]))
+        f.close()
+        if len(self.index) > 0:
+            self.data = numpy.memmap(os.path.join(datapath, ARCHIVENAME+'.bin'), dtype='<f8', mode='r')
+
+    def __contains__(self, isofile):
+        return isofile in self.index
+
+    def get(self, isofile):
+        (offset, length) = self.index[isofile]
+        block = numpy.array(self.data[offset:offset+len(TRACEFIELDS)*length]).reshape(len(TRACEFIELDS), length)
+        return dict(zip(TRACEFIELDS, block))
+
+def sourceStamp(datapath, isofile):
+    stamp = []
+    for ext in ['.plots', '.txt']:
+        st = os.stat(os.path.join(datapath, isofile+ext))
+        stamp += [str(st.st_size), repr(st.st_mtime)]
+    return stamp
+
+def isCurrent(datapath, isofile, stamp):
+    try:
+        return sourceStamp(datapath, isofile) == stamp
+    except OSError:
+        #the files are gone, the archive is all there is
+        return True
+
+def openFitTraceArchive(datapath):
+    if os.path.exists(os.path.join(datapath, ARCHIVENAME+'.idx')):
+        return FitTraceArchive(datapath)
+    return None
+
+def packFitTraces(datapath):
+    """
+    Packs every <isofile>.plots/<isofile>.txt pair in datapath into a
+    FitTraceArchive. The index is written last, so a partly written archive is
+    never picked up by the viewers. Returns the number of traces packed.
+    """
+    binPath = os.path.join(datapath, ARCHIVENAME+'.bin')
+    idxPath = os.path.join(datapath, ARCHIVENAME+'.idx')
+    binFile = open(binPath+'.tmp', 'wb')
+    idxFile = open(idxPath+'.tmp', 'w')
+    w = csv.writer(idxFile)
+    w.writerow(['isofile', 'offset', 'length', 'plotsSize', 'plotsMtime', 'txtSize', 'txtMtime'])
+    offset = 0
+    packed = 0
+    for plotsfile in sorted(glob.glob(os.path.join(datapath, '*.plots'))):
+        isofile = os.path.basename(plotsfile)[:-len('.plots')]
+        if not os.path.exists(os.path.join(datapath, isofile+'.txt')):
+            print 'skipping ' + isofile + ' : no .txt file'
+            continue
+        #stamped before reading, so a file rewritten meanwhile shows up as stale
+        stamp = sourceStamp(datapath, isofile)
+        trace = readFitTrace(datapath, isofile)
+        length = len(trace['dat'])
+        numpy.array([trace[k][0:length] for k in TRACEFIELDS], dtype='<f8').tofile(binFile)
+        w.writerow([isofile, offset, length] + stamp)
+        offset = offset + len(TRACEFIELDS)*length
+        packed += 1
+    binFile.close()
+    idxFile.close()
+    os.rename(binPath+'.tmp', binPath)
+    os.rename(idxPath+'.tmp', idxPath)
+    return packed
+
+def traceBytes(trace):
+    return sum(a.nbytes for a in trace.values())
+
+class FitTraceCache(object):
+    """
+    Bounded LRU cache of parsed fit traces keyed by isofile. Entries are
+    evicted oldest first once there are more than maxEntries of them or they
+    take more than maxBytes. Traces are read from the dataset's
+    FitTraceArchive when there is one, and from the .plots/.txt files
+    otherwise. Safe to share between threads.
+    """
+    def __init__(self, datapath, maxEntries=500, maxBytes=64*2**20):
+        self.datapath = datapath
+        self.archive = openFitTraceArchive(datapath)
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.traces = collections.OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __contains__(self, isofile):
+        with self.lock:
+            return isofile in self.traces
+
+    def get(self, isofile):
+        with self.lock:
+            if isofile in self.traces:
+                trace = self.traces.pop(isofile)
+                self.traces[isofile] = trace
+                self.hits += 1
+                return trace
+            self.misses += 1
+        if self.archive is not None and isofile in self.archive:
+            trace = self.archive.get(isofile)
+        else:
+            trace = readFitTrace(self.datapath, isofile)
+        self.put(isofile, trace)
+        return trace
+
+    def put(self, isofile, trace):
+        with self.lock:
+            if isofile in self.traces:
+                self.nbytes -= traceBytes(self.traces.pop(isofile))
+            self.traces[isofile] = trace
+            self.nbytes += traceBytes(trace)
+            while len(self.traces) > 1 and (len(self.traces) > self.maxEntries or self.nbytes > self.maxBytes):
+                (k, old) = self.traces.popitem(last=False)
+                self.nbytes -= traceBytes(old)
+
+    def stats(self):
+        with self.lock:
+            return {'hits':self.hits, 'misses':self.misses, 'entries':len(self.traces), 'bytes':self.nbytes}
+
+class FitTracePrefetcher(object):
+    """
+    Background thread that loads fit traces into a FitTraceCache ahead of
+    time. Each call to prefetch replaces whatever was still pending, so the
+    worker always follows the latest selection.
+    """
+    def __init__(self, cache):
+        self.cache = cache
+        self.pending = []
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def prefetch(self, isofiles):
+        with self.condition:
+            self.pending = [i for i in isofiles if not i in self.cache]
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while len(self.pending) == 0:
+                    self.condition.wait()
+                isofile = self.pending.pop(0)
+            try:
+                self.cache.get(isofile)
+            except Exception:
+                #unreadable fits are reported when they are actually selected
+                pass
+
+def neighbourItems(items, current, n):
+    """
+    The up to 2n entries of items either side of current, nearest first
+    (next, previous, second next, ...). Uses the start of items if current
+    isn't in it.
+    """
+    items = list(items)
+    try:
+        i = items.index(current)
+    except ValueError:
+        return items[:n]
+    neighbours = []
+    for k in range(1, n+1):
+        neighbours += items[i+k:i+k+1]
+        if i-k >= 0:
+            neighbours.append(items[i-k])
+    return neighbours
+
+if __name__ == '__main__':
+    datapath = str(sys.argv[1])
+    print 'packing fit traces in ' + datapath + '...'
+    sys.stdout.flush()
+    packed = packFitTraces(datapath)
+    print 'packed ' + str(packed) + ' traces into ' + os.path.join(datapath, ARCHIVENAME+'.bin')
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Sidecar binary cache for loaded _iso_res.csv files. After the first
+successful load the dataFrame (including the derived columns added by qMS)
+is written next to the csv as <csv>.<name>.feather (or .pkl when pyarrow is
+not installed) together with a small <csv>.<name>.cacheinfo file recording
+the size and mtime of the csv it came from. name identifies the loader, so
+frames loaded differently from the same csv never share a cache. The cache
+is ignored as soon as the csv changes.
+"""
+
+import os
+import csv
+import pandas
+
+CACHEVERSION = '1'
+
+def cacheBase(fullpath, name):
+    return fullpath + '.' + name
+
+def cacheInfoPath(fullpath, name):
+    return cacheBase(fullpath, name) + '.cacheinfo'
+
+def sourceStamp(fullpath):
+    st = os.stat(fullpath)
+    return {'version':CACHEVERSION, 'size':str(st.st_size), 'mtime':repr(st.st_mtime)}
+
+def readCacheInfo(fullpath, name):
+    if not os.path.exists(cacheInfoPath(fullpath, name)):
+        return None
+    f = open(cacheInfoPath(fullpath, name), 'r')
+    info = {}
+    for l in csv.reader(f):
+        info[l[0]] = l[1]
+    f.close()
+    return info
+
+def readCache(fullpath, name):
+    """
+    Returns the dataFrame cached for fullpath under name, or None if there is
+    no cache or it is out of date.
+    """
+    info = readCacheInfo(fullpath, name)
+    if info is None:
+        return None
+    stamp = sourceStamp(fullpath)
+    if any(info.get(k) != stamp[k] for k in stamp.keys()):
+        return None
+    try:
+        if info['format'] == 'feather':
+            return pandas.read_feather(info['path'])
+        else:
+            return pandas.read_pickle(info['path'])
+    except Exception as e:
+        print 'ignoring unreadable cache for ' + fullpath + ' : ' + str(e)
+        return None
+
+def removeQuietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def writeFrame(dataFrame, cachePath, writer):
+    """
+    Writes dataFrame with writer to a temporary file renamed to cachePath once
+    complete, so a failed write never leaves a partial cache behind.
+    """
+    try:
+        writer(dataFrame, cachePath + '.tmp')
+        os.rename(cachePath + '.tmp', cachePath)
+    except Exception:
+        removeQuietly(cachePath + '.tmp')
+        raise
+
+def writeCache(fullpath, name, dataFrame):
+    """
+    dataFrame is expected to have a default RangeIndex (see cachedLoad), which
+    is all feather can store, so both formats read back the same frame.
+    """
+    stamp = sourceStamp(fullpath)
+    try:
+        cachePath = cacheBase(fullpath, name) + '.feather'
+        writeFrame(dataFrame, cachePath, lambda df, p: df.to_feather(p))
+        stamp['format'] = 'feather'
+    except Exception:
+        #no pyarrow, or columns feather can't store
+        cachePath = cacheBase(fullpath, name) + '.pkl'
+        try:
+            writeFrame(dataFrame, cachePath, lambda df, p: df.to_pickle(p))
+        except (IOError, OSError) as e:
+            print 'could not write cache for ' + fullpath + ' : ' + str(e)
+            return
+        stamp['format'] = 'pickle'
+    stamp['path'] = cachePath
+
+    infoPath = cacheInfoPath(fullpath, name)
+    f = open(infoPath + '.tmp', 'w')
+    w = csv.writer(f)
+    for k in sorted(stamp.keys()):
+        w.writerow([k, stamp[k]])
+    f.close()
+    os.rename(infoPath + '.tmp', infoPath)
+
+def cachedLoad(fullpath, loader, name):
+    """
+    Returns loader(fullpath), going through the sidecar cache kept under name.
+    The frame's index is reset to the row positions, as cached frames have.
+    """
+    dataFrame = readCache(fullpath, name)
+    if dataFrame is None:
+        dataFrame = loader(fullpath)
+        dataFrame.reset_index(drop=True, inplace=True)
+        writeCache(fullpath, name, dataFrame)
+    return dataFrame
@@ -3,18 +3,50 @@ import wx
 import qMS
 import qMSDefs
 import string
-import csv
 import pandas as pd
 import numpy
 import sys
 import matplotlib.gridspec as gridspec
 import vizLib
+import masseFilter
+import fitTraces
+import masseStats
+import masseArtists
+import masseScheduler
+import robustStats
+import compactFrame
 import matplotlib
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_wxagg import \
     FigureCanvasWxAgg as FigCanvas, \
     NavigationToolbar2WxAgg as NavigationToolbar
 
+FITCACHEENTRIES = 500
+FITCACHEMB = 64
+PREFETCHN = 5
+#sort the filter columns at load so narrow ranges skip the scan; costs about
+#a second and 16 bytes per row per column on 1M rows, so off by default
+SORTEDINDEX = False
+
+class BlitToolbar(NavigationToolbar):
+    """
+    Navigation toolbar whose Save button also draws the given animated
+    artists, which are otherwise only ever blitted and so left out of a
+    saved figure.
+    """
+    def __init__(self, canvas, animated=[]):
+        NavigationToolbar.__init__(self, canvas)
+        self.animated = animated
+
+    def save_figure(self, *args):
+        for artist in self.animated:
+            artist.set_animated(False)
+        try:
+            NavigationToolbar.save_figure(self, *args)
+        finally:
+            for artist in self.animated:
+                artist.set_animated(True)
+
 class MasseFrame(wx.Frame):
     """ The main frame of the application
     """
@@ -67,13 +99,21 @@ class MasseFrame(wx.Frame):
         self.calcNum = ["AMP_U"]
         self.calcDen = ["AMP_U", "AMP_S"]
         self.currentHist = "ppmDiff"
-        self.savedPoints=None
-        self.filteredPoints=None
+        #bumped whenever the pass set or the plotted values change, see MedianCache
+        self.filterGeneration = 0
+        self.setPassMask(None)
         #self.positionLabels = qMSDefs.positionLabels70S
         self.currentDirectory = os.getcwd()
         self.dataFrame = df
+        self.medianCache = masseStats.MedianCache()
+        self.isofileIndex = masseFilter.RowIndex(self.dataFrame, 'isofile')
+        index = masseFilter.SortedColumnIndex(self.dataFrame) if SORTEDINDEX else None
+        self.filterState = masseFilter.FilterState(self.dataFrame, index=index)
+        self.recalcScheduler = masseScheduler.RecalcScheduler(self.gatherRecalc, self.computeRecalc, self.applyRecalc)
         self.datapath = dp
         self.datafile = fn
+        self.fitCache = fitTraces.FitTraceCache(self.datapath, maxEntries=FITCACHEENTRIES, maxBytes=FITCACHEMB*2**20)
+        self.fitPrefetcher = fitTraces.FitTracePrefetcher(self.fitCache)
         self.pulse=pulse
         self.varLab=varLab
         self.figdim = 7.5*fsize
@@ -96,12 +136,13 @@ class MasseFrame(wx.Frame):
         self.histPlotSelected = self.figRight.add_subplot(gsRight[4, :])
         self.figLeft.tight_layout()
         self.figRight.tight_layout()
+        self.init_figures()
         '''Create the list boxes'''
         self.savedList = wx.ListBox(self.panel, id=26, choices=[], style=wx.LB_SINGLE, name='Saved fits')
         self.filteredList = wx.ListBox(self.panel, id=26, choices=[], style=wx.LB_SINGLE, name='Filtered fits')
         
         '''Create the buttons'''
-        self.toolbarLeft = NavigationToolbar(self.canvasLeft)
+        self.toolbarLeft = BlitToolbar(self.canvasLeft, animated=[self.selectedPoint])
         self.toolbarRight = NavigationToolbar(self.canvasRight)
         
         self.cb_grid = wx.CheckBox(self.panel, wx.ID_ANY, label="Grid", style=wx.ALIGN_RIGHT)        
@@ -306,6 +347,7 @@ class MasseFrame(wx.Frame):
         
         '''bind events for buttons'''
         self.canvasLeft.mpl_connect('pick_event', self.pickScatterPoint)
+        self.canvasLeft.mpl_connect('draw_event', self.on_draw_left)
         
         self.r70S.Bind(wx.EVT_RADIOBUTTON, self.onr70S_select)
         self.r50S.Bind(wx.EVT_RADIOBUTTON, self.onr50S_select)
@@ -363,39 +405,21 @@ class MasseFrame(wx.Frame):
     def on_N3_button(self, event):
         self.setNormalValues(2.0)
     def setNormalValues(self, stds):
-        muPPM = self.dataFrame['ppmDiff'].median()
-        varPPM = self.dataFrame['ppmDiff'].std()
-        
-        mu14PPM = self.dataFrame['ppm_n14'].median()
-        var14PPM = self.dataFrame['ppm_n14'].std()
-        mu14PPM = self.dataFrame[(self.dataFrame['ppm_n14'] > mu14PPM-3*var14PPM) & (self.dataFrame['ppm_n14'] < mu14PPM+3*var14PPM)]['ppm_n14'].median()
-        
-        mu15PPM = self.dataFrame['ppm_n15'].median()
-        var15PPM = self.dataFrame['ppm_n15'].std()
-        mu15PPM = self.dataFrame[(self.dataFrame['ppm_n15'] > mu15PPM-3*var15PPM) & (self.dataFrame['ppm_n15'] < mu15PPM+3*var15PPM)]['ppm_n15'].median()
-        
-        if self.varLab:
-            muFRCNX = self.dataFrame['FRC_NX'].median()
-            varFRCNX = self.dataFrame['FRC_NX'].std()
-        
-        muRatio = self.dataFrame[(self.dataFrame['ratio'] > 0) & (self.dataFrame['ratio'] < 20)]['ratio'].median()
-        varRatio = self.dataFrame[(self.dataFrame['ratio'] > 0) & (self.dataFrame['ratio'] < 20)]['ratio'].std()
-        
-        self.ppmDiffRangeBypass.SetValue(str(round(muPPM-stds*varPPM,2)) + ' ' + str(round(muPPM+stds*varPPM,2)))
-        self.N14RangeBypass.SetValue(str(round(mu14PPM-stds*var14PPM,2)) + ' ' + str(round(mu14PPM+stds*var14PPM,2)))
-        self.N15RangeBypass.SetValue(str(round(mu15PPM-stds*var15PPM,2)) + ' ' + str(round(mu15PPM+stds*var15PPM,2)))
-        #self.ratioLimBypass.SetValue(str(round(muRatio-stds*varRatio,2)) + ' ' + str(round(muRatio+stds*varRatio,2)))
-        
+        """
+        Sets the ppm (and FRC_NX) ranges to median +- stds standard deviations,
+        both taken after iteratively clipping the values more than
+        robustStats.CLIPSIGMA deviations out.
+        """
+        boxes = {'ppmDiff':self.ppmDiffRangeBypass, 'ppm_n14':self.N14RangeBypass, 'ppm_n15':self.N15RangeBypass}
         if self.varLab:
-            self.FRC_NXRangeBypass.SetValue(str(round(muFRCNX-stds*varFRCNX,2)) + ' ' + str(round(muFRCNX+stds*varFRCNX,2)))
+            boxes['FRC_NX'] = self.FRC_NXRangeBypass
+        stats = robustStats.columnStats(self.dataFrame, boxes.keys(), spread='std')
+        for (col, box) in boxes.items():
+            (mu, sigma) = stats[col]
+            box.SetValue(str(round(mu-stds*sigma,2)) + ' ' + str(round(mu+stds*sigma,2)))
 
     def on_loadP_button(self, event):
-        f = open(self.datapath+'_last.filterParam', 'r')
-        params = csv.reader(f)
-        pdict = {}
-        for l in params:
-            pdict[l[0]] = l[1]
-        f.close()
+        pdict = masseFilter.readFilterParams(self.datapath+'_last.filterParam')
         self.lowCheckNum.SetValue(qMS.boolParse(pdict['lowNum']))
         if self.pulse:
             self.midCheckNum.SetValue(qMS.boolParse(pdict['midNum']))
@@ -433,12 +457,19 @@ class MasseFrame(wx.Frame):
         self.minIntensityOn.SetValue(qMS.boolParse(pdict['minIntensityOn']))
         self.handSaveOn.SetValue(qMS.boolParse(pdict['handSaveOn']))
         self.handDeleteOn.SetValue(qMS.boolParse(pdict['handDeleteOn']))
-        f.close()
         self.recalcAndDrawAll()
 
     def on_saveP_button(self, event):
         self.savePs(self.datapath+'_last.filterParam')
     def savePs(self, p):
+        outstr = 'param,' + 'value'
+        for (key, value) in self.getParams():
+            outstr = outstr + '\n' + key + ',' + value
+        f = open(p, 'w')
+        f.write(outstr)
+        f.close()
+
+    def getParams(self):
         (ppmDiff_low, ppmDiff_high) = map(str, self.ppmDiffRangeBypass.GetValue().split(' '))
         (ppm_n14_low, ppm_n14_high) = map(str, self.N14RangeBypass.GetValue().split(' '))
         (ppm_n15_low, ppm_n15_high) = map(str, self.N15RangeBypass.GetValue().split(' '))
@@ -451,49 +482,44 @@ class MasseFrame(wx.Frame):
         (gw_low, gw_high) = map(str, self.gwBypass.GetValue().split(' '))
         minI = float(self.minIntensityBypass.GetValue())
 
-        outstr = 'param,' + 'value'
-        
-        outstr = outstr + '\nppmDiff_low,' + ppmDiff_low + '\nppmDiff_high,' + ppmDiff_high
-        outstr = outstr + '\nppm_n14_low,' + ppm_n14_low + '\nppm_n14_high,' + ppm_n14_high
-        outstr = outstr + '\nppm_n15_low,' + ppm_n15_low + '\nppm_n15_high,' + ppm_n15_high
-        outstr = outstr + '\nmissed_low,' + missed_low + '\nmissed_high,' + missed_high
-        outstr = outstr + '\nrtDiff_low,' + rtDiff_low + '\nrtDiff_high,' + rtDiff_high
+        params = [('ppmDiff_low', ppmDiff_low), ('ppmDiff_high', ppmDiff_high)]
+        params += [('ppm_n14_low', ppm_n14_low), ('ppm_n14_high', ppm_n14_high)]
+        params += [('ppm_n15_low', ppm_n15_low), ('ppm_n15_high', ppm_n15_high)]
+        params += [('missed_low', missed_low), ('missed_high', missed_high)]
+        params += [('rtDiff_low', rtDiff_low), ('rtDiff_high', rtDiff_high)]
         if self.varLab:
-            outstr = outstr + '\nFRC_NX_low,' + FRC_NX_low + '\nFRC_NX_high,' + FRC_NX_high
-            outstr = outstr + '\nFRC_NX,' + str(self.FRC_NXOn.IsChecked())
-        outstr = outstr + '\nresid_low,' + resid_low + '\nresid_high,' + resid_high
-        outstr = outstr + '\nratio_low,' + ratio_low + '\nratio_high,' + ratio_high
-        outstr = outstr + '\nGW_low,' + gw_low + '\nGW_high,' + gw_high
-        outstr = outstr + '\nminIntensity,' + str(minI)
-        
-        outstr = outstr + '\ngridChecked,' + str(self.cb_grid.IsChecked())
-        outstr = outstr + '\nzoomChecked,' + str(self.zoomCheck.IsChecked())
-        outstr = outstr + '\nhideChecked,' + str(self.hideCheck.IsChecked())
-
-        outstr = outstr + '\nlowNum,' + str(self.lowCheckNum.IsChecked())
+            params += [('FRC_NX_low', FRC_NX_low), ('FRC_NX_high', FRC_NX_high)]
+            params += [('FRC_NX', str(self.FRC_NXOn.IsChecked()))]
+        params += [('resid_low', resid_low), ('resid_high', resid_high)]
+        params += [('ratio_low', ratio_low), ('ratio_high', ratio_high)]
+        params += [('GW_low', gw_low), ('GW_high', gw_high)]
+        params += [('minIntensity', str(minI))]
+
+        params += [('gridChecked', str(self.cb_grid.IsChecked()))]
+        params += [('zoomChecked', str(self.zoomCheck.IsChecked()))]
+        params += [('hideChecked', str(self.hideCheck.IsChecked()))]
+
+        params += [('lowNum', str(self.lowCheckNum.IsChecked()))]
         if self.pulse:
-            outstr = outstr + '\nmidNum,' + str(self.midCheckNum.IsChecked())
-        outstr = outstr + '\nhighNum,' + str(self.highCheckNum.IsChecked())
-        outstr = outstr + '\nlowDen,' + str(self.lowCheckDen.IsChecked())
+            params += [('midNum', str(self.midCheckNum.IsChecked()))]
+        params += [('highNum', str(self.highCheckNum.IsChecked()))]
+        params += [('lowDen', str(self.lowCheckDen.IsChecked()))]
         if self.pulse:
-            outstr = outstr + '\nmidDen,' + str(self.midCheckDen.IsChecked())
-        outstr = outstr + '\nhighDen,' + str(self.highCheckDen.IsChecked())
-        
-        outstr = outstr + '\nppmDiff,' + str(self.ppmDiffOn.IsChecked())
-        outstr = outstr + '\nn14,' + str(self.N14On.IsChecked())
-        outstr = outstr + '\nn15,' + str(self.N15On.IsChecked())
-        outstr = outstr + '\nmissed,' + str(self.missedOn.IsChecked())
-        outstr = outstr + '\nrtDiff,' + str(self.rtOn.IsChecked())
-        outstr = outstr + '\nresid,' + str(self.residOn.IsChecked())
-        outstr = outstr + '\nratio,' + str(self.ratioLimOn.IsChecked())
-        outstr = outstr + '\nGW,' + str(self.gwOn.IsChecked())
-        outstr = outstr + '\nminIntensityOn,' + str(self.minIntensityOn.IsChecked())
-        outstr = outstr + '\nhandSaveOn,' + str(self.handSaveOn.IsChecked())
-        outstr = outstr + '\nhandDeleteOn,' + str(self.handDeleteOn.IsChecked())
+            params += [('midDen', str(self.midCheckDen.IsChecked()))]
+        params += [('highDen', str(self.highCheckDen.IsChecked()))]
 
-        f = open(p, 'w')
-        f.write(outstr)
-        f.close()
+        params += [('ppmDiff', str(self.ppmDiffOn.IsChecked()))]
+        params += [('n14', str(self.N14On.IsChecked()))]
+        params += [('n15', str(self.N15On.IsChecked()))]
+        params += [('missed', str(self.missedOn.IsChecked()))]
+        params += [('rtDiff', str(self.rtOn.IsChecked()))]
+        params += [('resid', str(self.residOn.IsChecked()))]
+        params += [('ratio', str(self.ratioLimOn.IsChecked()))]
+        params += [('GW', str(self.gwOn.IsChecked()))]
+        params += [('minIntensityOn', str(self.minIntensityOn.IsChecked()))]
+        params += [('handSaveOn', str(self.handSaveOn.IsChecked()))]
+        params += [('handDeleteOn', str(self.handDeleteOn.IsChecked()))]
+        return params
         
     def onr70S_select(self, event):
         self.dataFrame['currentPos'] = self.dataFrame['70Spos']
@@ -553,8 +579,9 @@ class MasseFrame(wx.Frame):
             )
         if dlg.ShowModal() == wx.ID_OK:
             path = dlg.GetPath()
-            self.calcPoints()
-            self.savedPoints.to_csv(path, index=False)
+            with self.recalcScheduler.lock:
+                savedPoints = self.getPass(True)
+            savedPoints.to_csv(path, index=False)
             print path
             self.savePs(path[:-4]+'.filterParam')
         dlg.Destroy()
@@ -571,61 +598,61 @@ class MasseFrame(wx.Frame):
         
     def on_ppmDiff_range_button(self, event):
         self.currentHist = "ppmDiff"
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_N14_range_button(self, event):
         self.currentHist = "ppm_n14"
-        self.recalcAndDrawAll()        
+        self.recalcScheduler.request()        
     def on_N15_range_button(self, event):
         self.currentHist = "ppm_n15"
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_missed_range_button(self, event):
         self.currentHist = "missed"
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_rtDiff_range_button(self, event):
         self.currentHist = "rtDiff"
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_FRC_NX_range_button(self, event):
         self.currentHist = "FRC_NX"
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_resid_range_button(self, event):
         self.currentHist = "resid"
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_minIntensity_range_button(self, event):
         self.currentHist = "minIntensity"
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_ratio_range_button(self, event):
         self.currentHist = "ratio"
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_gw_range_button(self, event):
         self.currentHist = "GW"
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_calc_button(self, event):
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
 
     def on_ppmDiffOn(self, event):
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_N14On(self, event):
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_N15On(self, event):
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_missedOn(self, event):
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_rtOn(self, event):
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_residOn(self, event):
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_FRC_NXOn(self, event):
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_minIntensityOn(self, event):
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_ratioLimOn(self, event):
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_handSaveOn(self, event):
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_handDeleteOn(self, event):
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_gwOn(self, event):
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
 
     def on_exit(self, event):
         self.Destroy()
@@ -633,22 +660,20 @@ class MasseFrame(wx.Frame):
     def on_savedBoxClick(self, event):
         if not (self.savedList.GetStringSelection() is u''):
             self.currentISOFile = self.savedList.GetStringSelection()
-            self.currentRow = self.dataFrame[self.dataFrame['isofile'] == self.currentISOFile]
+            self.currentRow = self.isofileIndex.rows(self.currentISOFile)
             self.newSelection()
         
     def on_filteredBoxClick(self, event):
         if not (self.filteredList.GetStringSelection() is u''):
             self.currentISOFile = self.filteredList.GetStringSelection()
-            self.currentRow = self.dataFrame[self.dataFrame['isofile'] == self.currentISOFile]
+            self.currentRow = self.isofileIndex.rows(self.currentISOFile)
             self.newSelection()
 
     def on_key_press(self, event):
         event.Skip()
         c = event.GetKeyCode()
         if c is 68: #got a d keystroke
-            row = self.dataFrame[self.dataFrame['isofile'] == self.currentISOFile]
-            row['handDelete'] = True
-            row['handSave'] = False
+            flipped = self.markCurrent(save=False, delete=True)
 
             myIndex = list(self.savedListItems).index(self.currentISOFile)
             try:
@@ -656,79 +681,245 @@ class MasseFrame(wx.Frame):
             except IndexError:
                 nextItem = self.savedListItems[myIndex-1]
             self.currentISOFile = nextItem
-            self.currentRow = self.dataFrame[self.dataFrame['isofile'] == self.currentISOFile]
+            self.currentRow = self.isofileIndex.rows(self.currentISOFile)
 
             self.newSelection()            
-            self.dataFrame.update(row)
-            self.recalcAndDrawAll()
+            self.redrawFlipped(flipped)
             
         elif c is 83: # got a s keystroke
-            row = self.dataFrame[self.dataFrame['isofile'] == self.currentISOFile]
-            row['handDelete'] = False
-            row['handSave'] = True
-            self.dataFrame.update(row)
+            self.redrawFlipped(self.markCurrent(save=True, delete=False))
+
+    def markCurrent(self, save, delete):
+        """
+        Hand saves/deletes the current fit. Only its rows of the pass mask are
+        updated (see FilterState.setHand); returns the positions of the rows
+        that changed sides, or None if everything has to be recalculated (e.g.
+        a range was edited but not applied yet).
+        """
+        self.recalcScheduler.flush(False)
+        spec = masseFilter.parseFilterParams(dict(self.getParams()), varLab=self.varLab)
+        positions = self.isofileIndex.positions[self.currentISOFile]
+        with self.recalcScheduler.lock:
+            shown = self.passMask is not None and self.passMask is self.filterState.lastMask
+            before = self.passMask[positions].copy() if shown else None
+            self.filterState.setHand(positions, save, delete)
+            if not shown or spec != self.filterState.lastSpec or \
+                    [self.getChecksNum(), self.getChecksDen()] != [self.calcNum, self.calcDen]:
+                return None
+            return positions[self.passMask[positions] != before]
+
+    def redrawFlipped(self, flipped):
+        if flipped is None:
             self.recalcAndDrawAll()
+            return
+        with self.recalcScheduler.lock:
+            self.moveRows(flipped)
+
+    def moveRows(self, positions):
+        """
+        Moves the rows at positions, which have just changed sides in passMask,
+        between the saved and filtered lists and scatter lines, updates the
+        median line and the Selected histogram, and redraws both canvases.
+        """
+        self.views = {}
+        self.filterGeneration += 1
+        if len(positions) == 0:
+            return
+        toSaved = positions[self.passMask[positions]]
+        toFiltered = positions[~self.passMask[positions]]
+        isofiles = self.dataFrame['isofile'].values
+        self.savedListItems = moveListItems(self.savedList, self.savedListItems, isofiles[toFiltered], isofiles[toSaved])
+        self.filteredListItems = moveListItems(self.filteredList, self.filteredListItems, isofiles[toSaved], isofiles[toFiltered])
+        self.savedList.SetStringSelection(self.currentISOFile)
+        self.filteredList.SetStringSelection(self.currentISOFile)
+        self.moveLinePoints(self.savedLine, toFiltered, toSaved)
+        self.moveLinePoints(self.filteredLine, toSaved, toFiltered)
+        self.savedLine.set_label("Saved : " + str(len(self.savedLine.rowPositions)))
+        self.filteredLine.set_label("Filtered : " + str(len(self.filteredLine.rowPositions)))
+        self.updateMedians(self.dataFrame['currentPos'].values[positions])
+        self.PLPlot.legend()
+        name = self.currentHist
+        self.setHist(self.histPlotSelected, self.dataFrame[name].values[self.savedLine.rowPositions], name+'_Selected')
+        self.canvasLeft.draw()
+        self.canvasRight.draw()
+        self.prefetchFits()
+
+    def moveLinePoints(self, line, leaving, arriving):
+        keep = ~numpy.in1d(line.rowPositions, leaving)
+        positions = numpy.concatenate([line.rowPositions[keep], arriving])
+        line.set_data(numpy.concatenate([numpy.asarray(line.get_xdata())[keep], self.dataFrame['currentPos'].values[arriving]]),
+                      numpy.concatenate([numpy.asarray(line.get_ydata())[keep], self.dataFrame['currentCalc'].values[arriving]]))
+        masseArtists.tagRows(line, self.dataFrame, positions)
+
+    def updateMedians(self, xs):
+        """
+        Recomputes the median line at just the positions xs from the saved
+        points.
+        """
+        meds = dict(zip(*self.medianLine.get_data()))
+        savedX = numpy.asarray(self.savedLine.get_xdata(), dtype=float)
+        savedY = numpy.asarray(self.savedLine.get_ydata(), dtype=float)
+        for x in set(xs):
+            ys = savedY[savedX == x]
+            if len(ys) == 0:
+                meds.pop(float(x), None)
+            else:
+                meds[float(x)] = pd.Series(ys).median()
+        medX = sorted(meds)
+        medY = [meds[x] for x in medX]
+        self.medianLine.set_data(medX, medY)
+        self.medianLine.set_label("Median : " + str(round(numpy.median(medY),1)))
 
         
     def newSelection(self):
         self.calc_fit()
         self.canvasRight.draw()
-        self.selectedPoint.set_data(self.currentRow['currentPos'].values[0], self.currentRow['currentCalc'].values[0])
-        self.canvasLeft.draw()
+        self.moveSelectedPoint()
+        self.prefetchFits()
+
+    def prefetchFits(self):
+        self.fitPrefetcher.prefetch(fitTraces.neighbourItems(self.savedListItems, self.currentISOFile, PREFETCHN) + \
+                                    fitTraces.neighbourItems(self.filteredListItems, self.currentISOFile, PREFETCHN))
     
     def recalcAndDrawAll(self, setZero=False):
-        self.calc_data()
-        self.calcPoints()
+        self.recalcScheduler.runNow(setZero)
+
+    def gatherRecalc(self):
+        return [dict(self.getParams()), self.getChecksNum(), self.getChecksDen()]
+
+    def computeRecalc(self, inputs):
+        [params, calcNum, calcDen] = inputs
+        currentCalc = qMS.calcValue(self.dataFrame, calcNum, calcDen)
+        passMask = self.filterState.getPassMask(masseFilter.parseFilterParams(params, varLab=self.varLab))
+        return [calcNum, calcDen, currentCalc, passMask]
+
+    def applyRecalc(self, result, setZero=False):
+        [self.calcNum, self.calcDen, currentCalc, passMask] = result
+        self.UID_output_list = []
+        self.dataFrame['currentCalc'] = currentCalc
+        self.setPassMask(passMask)
         if setZero is True:
             self.currentRow = self.savedPoints[0:1]
             self.currentISOFile = self.currentRow['isofile'].values[0]
         else:
-            self.currentRow = self.dataFrame[self.dataFrame['isofile'] == self.currentISOFile]
+            self.currentRow = self.isofileIndex.rows(self.currentISOFile)
         self.updateLists()
         self.calc_figure()
         self.calc_hist()
         self.calc_fit()
         self.draw_all()
+        self.updateRangeCounts()
+        self.prefetchFits()
+
+    def updateRangeCounts(self):
+        spec = masseFilter.parseFilterParams(dict(self.getParams()), varLab=self.varLab)
+        boxes = {'ppmDiff':self.ppmDiffRangeBypass, 'ppm_n14':self.N14RangeBypass, 'ppm_n15':self.N15RangeBypass,
+                 'missed':self.missedRangeBypass, 'rtDiff':self.rtDiffRangeBypass, 'resid':self.residRangeBypass,
+                 'ratio':self.ratioLimBypass, 'GW':self.gwBypass, 'minIntensity':self.minIntensityBypass}
+        if self.varLab:
+            boxes['FRC_NX'] = self.FRC_NXRangeBypass
+        for (col, limits) in spec['ranges'].items():
+            if col in boxes:
+                boxes[col].SetToolTipString(str(self.filterState.rangeCount(col, limits)) + ' of ' + \
+                                            str(len(self.dataFrame)) + ' fits in range')
     
-    def calc_data(self):
-        self.UID_output_list = []  
-        self.calcNum = self.getChecksNum()
-        self.calcDen = self.getChecksDen()
-        self.dataFrame['currentCalc'] = qMS.calcValue(self.dataFrame, self.calcNum, self.calcDen)
-        
-    def calcPoints(self):
-        self.savedPoints = self.getPass(True)
-        self.filteredPoints = self.getPass(False)
+    def setPassMask(self, passMask):
+        """
+        The saved/filtered views are only sliced from dataFrame when first read
+        after passMask changes, so hand curating doesn't copy the frame.
+        """
+        self.passMask = passMask
+        self.views = {}
+        self.filterGeneration += 1
+
+    def passView(self, saved):
+        if self.passMask is None:
+            return None
+        if not saved in self.views:
+            self.views[saved] = self.dataFrame[self.passMask if saved else ~self.passMask]
+        return self.views[saved]
+
+    savedPoints = property(lambda self: self.passView(True))
+    filteredPoints = property(lambda self: self.passView(False))
 
     def updateLists(self):
         self.savedListItems = self.savedPoints['isofile'].values
         sli = qMS.sort_nicely(list(self.savedListItems))
-        self.savedListItems = numpy.array(sli)
+        self.savedListItems = numpy.array(sli, dtype=object)
         self.filteredListItems = self.filteredPoints['isofile'].values
         fli = qMS.sort_nicely(list(self.filteredListItems))
-        self.filteredListItems = numpy.array(fli)
+        self.filteredListItems = numpy.array(fli, dtype=object)
         self.savedList.Set(self.savedListItems)
         self.filteredList.Set(self.filteredListItems)
         self.savedList.SetStringSelection(self.currentISOFile)
         self.filteredList.SetStringSelection(self.currentISOFile)
 
     def determineMedians(self):
-        xs = list(set(self.savedPoints['currentPos']))
-        ys = [self.savedPoints[self.savedPoints['currentPos']==k]['currentCalc'].median() for k in xs]
-        return [xs,ys]
+        return self.medianCache.get(self.savedPoints, 'currentPos', self.filterGeneration)
         
+    def init_figures(self):
+        """
+        Creates the plot artists once; calc_figure, calc_fit and calc_hist only
+        update their data. The selection marker is animated and blitted over a
+        saved background so moving it doesn't redraw the scatter.
+        """
+        self.selectedPoint, = self.PLPlot.plot([], [], 'o', ms=20, alpha=0.5, color='yellow', animated=True)
+        self.savedLine, = self.PLPlot.plot([], [], 'ro', picker=5)
+        self.medianLine, = self.PLPlot.plot([], [], 'g-', lw=2)
+        self.filteredLine, = self.PLPlot.plot([], [], 'bo', picker=5)
+        self.leftBackground = None
+
+        self.fitDataPoints, = self.PNGPlot.plot([], [], 'o', markersize=6, markerfacecolor='None', markeredgecolor='red')
+        self.fitDataLine, = self.PNGPlot.plot([], [], 'r-', linewidth=2, label='data')
+        self.fitFitLine, = self.PNGPlot.plot([], [], 'b-', linewidth=2, label='fit')
+        self.fitResidLine, = self.PNGPlot.plot([], [], 'g-', linewidth=2, label='residual')
+        self.PNGPlot.set_xlabel('m/z')
+        self.PNGPlot.set_ylabel('intensity')
+        self.PNGPlot.legend()
+        self.fitStatsText = self.PNGPlot.text(0.98, 0.45, '', horizontalalignment='right', verticalalignment='top',
+                                              transform = self.PNGPlot.transAxes)
+        self.fitPeptideText = self.PNGPlot.text(0.02, 0.98, '', horizontalalignment='left', verticalalignment='top',
+                                                transform = self.PNGPlot.transAxes)
+
+        self.histBars = {self.histPlotAll:[], self.histPlotSelected:[]}
+        self.histLabels = {}
+        for ax in [self.histPlotAll, self.histPlotSelected]:
+            self.histLabels[ax] = ax.text(0.05,0.75,'', transform=ax.transAxes)
+
+    def on_draw_left(self, event):
+        self.leftBackground = self.canvasLeft.copy_from_bbox(self.PLPlot.bbox)
+        self.PLPlot.draw_artist(self.selectedPoint)
+        self.canvasLeft.blit(self.PLPlot.bbox)
+
+    def moveSelectedPoint(self):
+        self.selectedPoint.set_data(self.currentRow['currentPos'].values[0], self.currentRow['currentCalc'].values[0])
+        if self.leftBackground is None:
+            self.canvasLeft.draw()
+            return
+        self.canvasLeft.restore_region(self.leftBackground)
+        self.PLPlot.draw_artist(self.selectedPoint)
+        self.canvasLeft.blit(self.PLPlot.bbox)
+
     def calc_figure(self):
-        self.PLPlot.clear()
-        self.selectedPoint, = self.PLPlot.plot(self.currentRow['currentPos'].values[0], self.currentRow['currentCalc'].values[0], 
-                                              'o', ms=20, alpha=0.5, color='yellow', visible=True)
+        self.selectedPoint.set_data(self.currentRow['currentPos'].values[0], self.currentRow['currentCalc'].values[0])
         self.PLPlot.grid(self.cb_grid.IsChecked())
-        self.PLPlot.plot(self.savedPoints['currentPos'], self.savedPoints['currentCalc'], 'ro', picker=5, label="Saved : " + str(len(self.savedPoints['currentCalc'].values)))
+        self.savedLine.set_data(self.savedPoints['currentPos'].values, self.savedPoints['currentCalc'].values)
+        self.savedLine.set_label("Saved : " + str(len(self.savedPoints['currentCalc'].values)))
+        masseArtists.tagRows(self.savedLine, self.dataFrame, numpy.flatnonzero(self.passMask))
         meds = self.determineMedians()
-        self.PLPlot.plot(meds[0], meds[1], 'g-', lw=2, label="Median : " + str(round(numpy.median(meds[1]),1)))
+        self.medianLine.set_data(meds[0], meds[1])
+        self.medianLine.set_label("Median : " + str(round(numpy.median(meds[1]),1)))
         if self.hideCheck.IsChecked():
-            self.PLPlot.plot(self.filteredPoints['currentPos'], self.filteredPoints['currentCalc'], 'x', mec='grey', picker=5, label="Filtered : " + str(len(self.filteredPoints['currentCalc'].values)))
+            self.filteredLine.set_marker('x')
+            self.filteredLine.set_color('grey')
+            self.filteredLine.set_markeredgecolor('grey')
         else:
-            self.PLPlot.plot(self.filteredPoints['currentPos'], self.filteredPoints['currentCalc'], 'bo', picker=5, label="Filtered : "  + str(len(self.filteredPoints['currentCalc'].values)))
+            self.filteredLine.set_marker('o')
+            self.filteredLine.set_color('b')
+            self.filteredLine.set_markeredgecolor('b')
+        self.filteredLine.set_data(self.filteredPoints['currentPos'].values, self.filteredPoints['currentCalc'].values)
+        self.filteredLine.set_label("Filtered : " + str(len(self.filteredPoints['currentCalc'].values)))
+        masseArtists.tagRows(self.filteredLine, self.dataFrame, numpy.flatnonzero(~self.passMask))
         self.PLPlot.set_xticks(range(1,int(self.dataFrame['currentPos'].max())+1))
         self.PLPlot.set_xticklabels(self.positionLabels, rotation=90, size='small')
         self.PLPlot.set_title(self.datafile + " : " + setCurrentFrac(self.calcNum, self.calcDen))
@@ -740,22 +931,15 @@ class MasseFrame(wx.Frame):
         self.PLPlot.legend()
     
     def calc_fit(self):
-        plotsfile = self.datapath+self.currentISOFile+'.plots'
-        txtfile = self.datapath+self.currentISOFile+'.txt'
-        df = pd.read_csv(plotsfile)
-        df2 = pd.read_csv(txtfile, header=None, sep=' ')
-        del df['residAdj']
-        self.PNGPlot.clear()
-        #self.PNGPlot.plot(df2[0][0:len(df['dat'])].values, df['dat'].values, 'o', markersize=3, label='data', markerfacecolor='None', markeredgecolor='red')
-        self.PNGPlot.plot(df2[0][0:len(df['dat'])].values, df['dat'].values, 'o', markersize=6, markerfacecolor='None', markeredgecolor='red')
-        self.PNGPlot.plot(df2[0][0:len(df['dat'])].values, df['dat'].values, 'r-', linewidth=2, label='data')
-        self.PNGPlot.plot(df2[0][0:len(df['fit'])].values, df['fit'].values, 'b-', linewidth=2, label='fit')
-        self.PNGPlot.plot(df2[0][0:len(df['resid'])].values, df['resid'].values, 'g-', linewidth=2, label='residual')
-        self.PNGPlot.set_xlabel('m/z')
-        self.PNGPlot.set_ylabel('intensity')
-        self.PNGPlot.set_xlim(df2[0][0:len(df['dat'])].values.min(), df2[0][0:len(df['dat'])].values.max())
-        self.PNGPlot.legend()
-        row = self.dataFrame[self.dataFrame['isofile'] == self.currentISOFile]
+        trace = self.fitCache.get(self.currentISOFile)
+        self.fitDataPoints.set_data(trace['mz'], trace['dat'])
+        self.fitDataLine.set_data(trace['mz'], trace['dat'])
+        self.fitFitLine.set_data(trace['mz'], trace['fit'])
+        self.fitResidLine.set_data(trace['mz'], trace['resid'])
+        self.PNGPlot.set_xlim(trace['mz'].min(), trace['mz'].max())
+        self.PNGPlot.relim()
+        self.PNGPlot.autoscale_view(scalex=False)
+        row = self.isofileIndex.rows(self.currentISOFile)
         passing = self.testPassRow(row)
         stringColor = 'black'
         if row['handDelete'].values[0] is True:
@@ -775,34 +959,42 @@ class MasseFrame(wx.Frame):
                         
         if self.varLab:
             dataString = dataString + "\nFRC_NX: " + str(round(row['FRC_NX'].values[0],3)) + " : " + str(passing['FRC_NX'])
-        self.PNGPlot.text(0.98, 0.45,dataString,
-                          horizontalalignment='right',
-                          verticalalignment='top',
-                          transform = self.PNGPlot.transAxes,
-                          color = stringColor)
+        self.fitStatsText.set_text(dataString)
+        self.fitStatsText.set_color(stringColor)
         
         dataString = str(row['seqmod'].values[0]) + " : z=" + str(row['charge'].values[0])
-        self.PNGPlot.text(0.02, 0.98,dataString,
-                          horizontalalignment='left',
-                          verticalalignment='top',
-                          transform = self.PNGPlot.transAxes,
-                          color = stringColor)
+        self.fitPeptideText.set_text(dataString)
+        self.fitPeptideText.set_color(stringColor)
         self.PNGPlot.set_title(self.currentISOFile)
 
     def calc_hist(self):
         name = self.currentHist
-        dataAll = self.dataFrame[name]
-        dataSelected=self.savedPoints[name]
-        
-        bin_num = min(30, len(list(set(dataAll))))
-        self.histPlotAll.clear()
-        self.histPlotAll.hist(dataAll, bins = bin_num)
-        self.histPlotAll.text(0.05,0.75,name+'_All', transform=self.histPlotAll.transAxes)
-        
-        bin_num = min(30, len(list(set(dataSelected))))
-        self.histPlotSelected.clear()
-        self.histPlotSelected.hist(dataSelected.values, bins = bin_num)
-        self.histPlotSelected.text(0.05,0.75,name+'_Selected', transform=self.histPlotSelected.transAxes)
+        self.setHist(self.histPlotAll, self.dataFrame[name].values, name+'_All')
+        self.setHist(self.histPlotSelected, self.savedPoints[name].values, name+'_Selected')
+
+    def setHist(self, ax, data, label):
+        """
+        Updates the bars of a histogram in place, only recreating them when the
+        number of bins changes.
+        """
+        data = numpy.asarray(data, dtype=float)
+        data = data[numpy.isfinite(data)]
+        bin_num = max(min(30, len(numpy.unique(data))), 1)
+        (counts, edges) = numpy.histogram(data, bins=bin_num)
+        if len(self.histBars[ax]) != len(counts):
+            #keep the colour of the first bars, as the axes' colour cycle is no longer reset by clear()
+            color = self.histBars[ax][0].get_facecolor() if len(self.histBars[ax]) > 0 else None
+            for bar in self.histBars[ax]:
+                bar.remove()
+            self.histBars[ax] = list(ax.hist(data, bins=edges, color=color)[2])
+        else:
+            for (bar, x, w, h) in zip(self.histBars[ax], edges[:-1], numpy.diff(edges), counts):
+                bar.set_x(x)
+                bar.set_width(w)
+                bar.set_height(h)
+        ax.set_xlim(edges[0], edges[-1])
+        ax.set_ylim(0, max(counts.max(), 1)*1.05)
+        self.histLabels[ax].set_text(label)
     
     def draw_all(self):
         self.canvasLeft.draw()
@@ -859,53 +1051,54 @@ class MasseFrame(wx.Frame):
         return passing
 
     def getPass(self, t):
-        self.findRanges()
-        filt = self.dataFrame['missed'] >= -1
-        if self.ppmDiffOn.IsChecked():
-            filt =  (self.dataFrame['ppmDiff'] >= self.ppmDiff_low) & (self.dataFrame['ppmDiff'] <= self.ppmDiff_high) 
-        if self.N14On.IsChecked():
-            filt = filt & (self.dataFrame['ppm_n14'] >= self.ppm_n14_low) & (self.dataFrame['ppm_n14'] <= self.ppm_n14_high)
-        if self.N15On.IsChecked():
-            filt = filt & (self.dataFrame['ppm_n15'] >= self.ppm_n15_low) & (self.dataFrame['ppm_n15'] <= self.ppm_n15_high)
-        if self.missedOn.IsChecked():
-            filt = filt & (self.dataFrame['missed'] >= self.missed_low) & (self.dataFrame['missed'] <= self.missed_high)
-        if self.rtOn.IsChecked():
-            filt = filt & (self.dataFrame['rtDiff'] >= self.rtDiff_low) & (self.dataFrame['rtDiff'] <= self.rtDiff_high)
-        if self.residOn.IsChecked():
-            filt = filt & (self.dataFrame['resid'] >= self.resid_low) & (self.dataFrame['resid'] <= self.resid_high)
-        if self.ratioLimOn.IsChecked():
-            filt = filt & (self.dataFrame['ratio'] >= self.ratio_low) & (self.dataFrame['ratio'] <= self.ratio_high)
-        if self.gwOn.IsChecked():
-            filt = filt & (self.dataFrame['GW'] >= self.gw_low) & (self.dataFrame['GW'] <= self.gw_high)
-        if self.minIntensityOn.IsChecked():
-            filt = filt & (self.dataFrame['minIntensity'] >= self.minIntensity)
-        if self.varLab:
-            if self.FRC_NXOn.IsChecked():
-                filt = filt & (self.dataFrame['FRC_NX'] >= self.FRC_NX_low) & (self.dataFrame['FRC_NX'] <= self.FRC_NX_high)
-        if self.handSaveOn.IsChecked():
-            filt = filt | (self.dataFrame['handSave'] == True)
-        if self.handDeleteOn.IsChecked():
-            filt = filt & (self.dataFrame['handDelete'] == False)
-        if t:
-            return self.dataFrame[filt]
-        else:
-            return self.dataFrame[~filt]
+        spec = masseFilter.parseFilterParams(dict(self.getParams()), varLab=self.varLab)
+        return self.filterState.getPass(spec, t)
             
     def pickScatterPoint(self, event):
-        ind = event.ind
-        thisline = event.artist
-        ydata = thisline.get_ydata()
-        xdata = thisline.get_xdata()
-        self.currentRow = self.dataFrame[   (self.dataFrame['currentCalc'] == ydata[ind][0]) & \
-                                                ((self.dataFrame['currentPos'] == xdata[ind][0]))]
-        self.currentISOFile = self.currentRow['isofile'].values[0]
-        self.selectedPoint.set_data(self.currentRow['currentPos'].values[0], self.currentRow['currentCalc'].values[0])
-        self.canvasLeft.draw()
+        rows = masseArtists.pickedRows(event)
+        if rows is None:
+            return
+        self.currentISOFile = rows['isofile'].values[masseArtists.cyclePick(rows, 'isofile', self.currentISOFile)]
+        self.currentRow = self.isofileIndex.rows(self.currentISOFile)
+        self.moveSelectedPoint()
         self.calc_fit()
         self.canvasRight.draw()
         self.savedList.SetStringSelection(self.currentISOFile)
         self.filteredList.SetStringSelection(self.currentISOFile)
+        self.prefetchFits()
         
+def nicelyIndex(items, item):
+    """
+    Where item goes in items, which are in qMS.sort_nicely order, by
+    bisection so only a handful of items are compared.
+    """
+    (lo, hi) = (0, len(items))
+    while lo < hi:
+        mid = (lo+hi)//2
+        if qMS.sort_nicely([item, items[mid]])[0] == item:
+            hi = mid
+        else:
+            lo = mid+1
+    return lo
+
+def moveListItems(listBox, items, leaving, arriving):
+    """
+    Takes one entry of each of leaving out of items and listBox and puts each
+    of arriving into its sorted place. Returns the new items.
+    """
+    for item in leaving:
+        #item is at or just after where it would be inserted
+        i = nicelyIndex(items, item)
+        while items[i] != item:
+            i += 1
+        items = numpy.delete(items, i)
+        listBox.Delete(i)
+    for item in arriving:
+        i = nicelyIndex(items, item)
+        items = numpy.insert(items, i, item)
+        listBox.Insert(item, i)
+    return items
+
 def setCurrentFrac(calcNum, calcDen):
     num = [i[-1:] for i in calcNum]
     den = [i[-1:] for i in calcDen]
@@ -918,18 +1111,15 @@ def transformValue(inputData, transformData, toTransform, normalizeTo):
     inputTransformed = inputNormOffset*float(inputData.loc[normalizeTo])
     return inputTransformed
 
-def openFile(fullpath):
-    r = csv.reader(open(fullpath))
-    header = r.next()
-    
-    if not ('resid' in header and 'minIntensity' in header and 'ratio' in header and 'currentCalc' in header):
-        print "preprocesing : " + fullpath + "..."
-        dataFrame = qMS.preProcessIsoCSV(fullpath, True)
-    else:
-        dataFrame = qMS.readIsoCSV(fullpath, noProcess=False)
-
-    puls = 'AMP_L' in dataFrame.columns
-    vla = 'FRC_NX' in dataFrame.columns
+def openFile(fullpath, compact=False):
+    """
+    compact stores the filter measures as float32 and the protein/TID columns
+    as categoricals (see compactFrame.py). Every column is kept, as the
+    export writes the saved rows back out in full.
+    """
+    [dataFrame, puls, vla] = masseFilter.openIsoFile(fullpath)
+    if compact:
+        compactFrame.compactLoaded(dataFrame)
     return [dataFrame, puls, vla]
 
 def startApp(dataFrame, datapath, filename, pulse, varLab, fsize=None, size=None):
@@ -948,7 +1138,7 @@ def startApp(dataFrame, datapath, filename, pulse, varLab, fsize=None, size=None
     app.frame.Show()
     app.MainLoop()    
 
-def fileOpenStart(pathToFile=None):
+def fileOpenStart(pathToFile=None, compact=False):
         """
         Create and show the Open FileDialog
         """
@@ -971,7 +1161,7 @@ def fileOpenStart(pathToFile=None):
         dp = '/'.join(hold.split('/')[:-1])+'/'
         fn = hold.split('/')[-1]
         print "opening file : " + pathToFile + "..."
-        [df, p, vl] = openFile(pathToFile)
+        [df, p, vl] = openFile(pathToFile, compact=compact)
         return [df, dp, fn, p, vl]
         frame.Destroy()
         app.Destroy()
@@ -986,6 +1176,8 @@ if __name__ == '__main__':
     #size=1.0
     fsize=None
     size=None
-    [dfr, dpa, fna, pul, vlab] = fileOpenStart(pathToFile)
+    #compact=True shrinks the memory of large datasets (float32 and categorical columns)
+    compact=False
+    [dfr, dpa, fna, pul, vlab] = fileOpenStart(pathToFile, compact=compact)
     
     startApp(dfr, dpa, fna, pul, vlab, fsize=fsize, size=size)
\ No newline at end of file
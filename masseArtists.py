@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Helpers for the matplotlib artists drawn by the masse viewers.
+"""
+
+def tagRows(line, view, positions=None):
+    """
+    Remembers the rows of view that line was plotted from, in plotting order,
+    so a pick on line can be mapped straight back to them. With positions the
+    points are the rows of view at those positions, so points can be moved
+    between lines without slicing a new view.
+    """
+    line.rowView = view
+    line.rowPositions = positions
+    return line
+
+def pickedRows(event):
+    """
+    The rows under a pick on a tagged line: the picked point plus every point
+    drawn at exactly the same position. None if the artist isn't tagged.
+    """
+    view = getattr(event.artist, 'rowView', None)
+    if view is None or len(event.ind) == 0:
+        return None
+    xdata = event.artist.get_xdata()
+    ydata = event.artist.get_ydata()
+    first = event.ind[0]
+    ind = [i for i in event.ind if xdata[i] == xdata[first] and ydata[i] == ydata[first]]
+    positions = getattr(event.artist, 'rowPositions', None)
+    if positions is not None:
+        ind = positions[ind]
+    return view.iloc[ind]
+
+def cyclePick(rows, key, current):
+    """
+    Position in rows to select for a pick. Repeated picks on a stack of
+    co-located points step through them, starting after the current one.
+    """
+    keys = list(rows[key].values)
+    if current in keys:
+        return (keys.index(current)+1) % len(keys)
+    return 0
@@ -4,11 +4,19 @@ import qMS
 import qMSDefs
 import string
 import csv
+import collections
 import pandas
 import numpy
 import sys
 import matplotlib.gridspec as gridspec
 import vizLib
+import fitTraces
+import masseFilter
+import masseStats
+import masseArtists
+import masseScheduler
+import compactFrame
+import robustStats
 import matplotlib
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_wxagg import \
@@ -19,7 +27,15 @@ FILENAMEHEADER = 'shortName'
 UIDHEADER = 'UID'
 ISOFILEHEADER = 'isofile'
 PROTEINHEADER = 'protein'
+#what the export writes besides the _filt.csv: any of masseStats.SUMMARYSTATS, as 'csv' or 'parquet'
+SUMMARYSTATS = ['median']
+SUMMARYFORMAT = 'csv'
+#the Auto button sets each dataset's ranges to its median +- SUGGESTSIGMAS clipped sigmas
+SUGGESTSIGMAS = 2.0
 FIGSIZE = 7.5
+FITCACHEENTRIES = 500
+FITCACHEMB = 64
+PREFETCHN = 5
 
 class MasseFrame(wx.Frame):
     """ The main frame of the application
@@ -45,7 +61,7 @@ class MasseFrame(wx.Frame):
         self.lastHistLimBypass.SetValue('-1 1')
         self.proteinZoomRangeBypass.SetValue('0 60')
         self.recalcAll()
-        self.currentRow = self.dataFrame[self.dataFrame[UIDHEADER] == self.currentRow[UIDHEADER]].iloc[0]
+        self.currentRow = self.uidIndex.row(self.currentRow[UIDHEADER])
         self.redrawAll(setZero=True)
 
     def create_main_panel(self, df, dp, fn, pulse=False, varLab=False, fsize=1.0, size=1.0):
@@ -64,8 +80,18 @@ class MasseFrame(wx.Frame):
         self.calcDen = ["AMP_U", "AMP_S"]
         self.currentDirectory = os.getcwd()
         self.dataFrame = df
-        self.dataFrame['minIntensity'].replace([-numpy.inf, numpy.inf], numpy.nan, inplace=True)
-        self.dataFrame['minIntensity'].fillna(0, inplace=True)
+        self.medianCache = masseStats.MedianCache()
+        #bumped whenever allClear or the plotted values change, see MedianCache
+        self.filterGeneration = 0
+        self.uidIndex = masseFilter.RowIndex(self.dataFrame, UIDHEADER)
+        self.tidIndex = masseFilter.RowIndex(self.dataFrame, 'TID')
+        #row positions of each dataset, so a dataset is filtered without scanning the others
+        self.datasetIndex = masseFilter.RowIndex(self.dataFrame, FILENAMEHEADER)
+        self.recalcData = False
+        #hand save/delete checks allClear was last built with over the whole frame
+        self.handChecks = None
+        self.recalcScheduler = masseScheduler.RecalcScheduler(self.gatherFilters, self.computeFilters, self.applyFilters)
+        masseFilter.normalizeMinIntensity(self.dataFrame)
         self.dataFrame['currentPosDataset'] = self.dataFrame['currentPos']
         frh = {'ppmDiff_low':-100, 'ppmDiff_high':100, 'ppm_n14_low':-100, 'ppm_n14_high':100,
                'ppm_n15_low':-100, 'ppm_n15_high':100, 'resid':100, 'ratio_low': 0, 'ratio_high':1000} 
@@ -80,12 +106,14 @@ class MasseFrame(wx.Frame):
         startDataset = qMS.sort_nicely(sorted(self.dataFrame[FILENAMEHEADER].unique()))[0]
         self.datasetView = self.dataFrame[self.dataFrame[FILENAMEHEADER] == startDataset]
         startUID = qMS.sort_nicely(list(self.datasetView[self.datasetView['allClear'] == True][UIDHEADER].values))[0]
-        self.currentRow = self.datasetView[self.datasetView[UIDHEADER] == startUID].iloc[0]
+        self.currentRow = self.uidIndex.row(startUID)
 
         self.proteinView = self.dataFrame[self.dataFrame[PROTEINHEADER] == self.currentRow[PROTEINHEADER]]
 
         self.datapath = dp
         self.datafile = fn
+        self.fitCache = fitTraces.FitTraceCache(self.datapath, maxEntries=FITCACHEENTRIES, maxBytes=FITCACHEMB*2**20)
+        self.fitPrefetcher = fitTraces.FitTracePrefetcher(self.fitCache)
         self.pulse=pulse
         self.varLab=varLab
         self.figdim = FIGSIZE*fsize
@@ -127,6 +155,8 @@ class MasseFrame(wx.Frame):
         self.openButton = wx.Button(self.panel, wx.ID_ANY, "Open")
                 
         self.calcButton = wx.Button(self.panel, wx.ID_ANY, "Calc", size=(57*size,40))
+        self.filterAllButton = wx.Button(self.panel, wx.ID_ANY, "Filt all", size=(57*size,-1))
+        self.suggestButton = wx.Button(self.panel, wx.ID_ANY, "Auto", size=(57*size,-1))
         
         self.lowCheckNum = wx.CheckBox(self.panel, wx.ID_ANY, label="low")
         if self.pulse:
@@ -205,6 +235,8 @@ class MasseFrame(wx.Frame):
         #add calculate button
         self.calcNBox = wx.StaticBoxSizer(wx.StaticBox(self.panel,wx.ID_ANY,'calcDist'), wx.VERTICAL)
         self.calcNBox.Add(self.calcButton, flag=wx.ALIGN_TOP)
+        self.calcNBox.Add(self.filterAllButton, flag=wx.ALIGN_TOP)
+        self.calcNBox.Add(self.suggestButton, flag=wx.ALIGN_TOP)
         self.calcNBox.Add(self.priorFilters, 0, flag=wx.ALIGN_LEFT)
         self.toolNumBox.Add(self.calcNBox, 0, flag=wx.ALIGN_RIGHT | wx.GROW)
         
@@ -273,6 +305,8 @@ class MasseFrame(wx.Frame):
         self.exportButton.Bind(wx.EVT_BUTTON, self.on_export_button)
         self.openButton.Bind(wx.EVT_BUTTON, self.on_open_button)
         self.calcButton.Bind(wx.EVT_BUTTON, self.on_recalc)
+        self.filterAllButton.Bind(wx.EVT_BUTTON, self.on_filterAll_button)
+        self.suggestButton.Bind(wx.EVT_BUTTON, self.on_suggest_button)
         self.cb_grid.Bind(wx.EVT_CHECKBOX, self.on_redraw)
         self.hideCheck.Bind(wx.EVT_CHECKBOX, self.on_redraw)
         self.zoomCheck.Bind(wx.EVT_CHECKBOX, self.on_redraw)
@@ -337,21 +371,25 @@ class MasseFrame(wx.Frame):
             self.redrawAll()
             self.dataFrame['priorFilter'] = self.dataFrame['allFPass']
             self.dataFrame.to_csv(path, index=False)
+            masseFilter.writeRangeHash(path[:-4]+'.filterRanges', self.filterRangeHash, calcFractions=[self.calcNum, self.calcDen])
             summaryCSVPath = path.split('.')[0] + '_median_[' + ''.join(self.calcNum) + ']_[' + ''.join(self.calcDen) + '].csv'
             self.writeSummaryCSV(summaryCSVPath)
             
         dlg.Destroy()
 
-    def writeSummaryCSV(self, path):
-        csvDict = {}
+    def writeSummaryCSV(self, path, stats=None, fileFormat=None):
+        """
+        protein x fraction medians of currentCalc, plus the other SUMMARYSTATS
+        in files of their own.
+        """
+        if stats is None:
+            stats = SUMMARYSTATS
+        if fileFormat is None:
+            fileFormat = SUMMARYFORMAT
         proteins = qMS.sort_nicely(sorted(set(self.dataFrame[PROTEINHEADER].values)))
         fractions = qMS.sort_nicely(sorted(set(self.dataFrame[FILENAMEHEADER].values)))
-        for frac in fractions:
-            csvDict[frac] = pandas.Series([self.dataFrame[(self.dataFrame[FILENAMEHEADER] == frac) & \
-                                        (self.dataFrame[PROTEINHEADER] == i)] \
-                                        ['currentCalc'].median() for i in proteins], index=proteins)
-        summaryDF = pandas.DataFrame(csvDict, columns = fractions)
-        summaryDF.to_csv(path)
+        tables = masseStats.groupedSummary(self.dataFrame, PROTEINHEADER, FILENAMEHEADER, stats=stats, rows=proteins, cols=fractions)
+        return masseStats.writeSummaryTables(tables, path, fileFormat=fileFormat)
     def on_exit(self, event):
         self.Destroy()
     
@@ -359,12 +397,11 @@ class MasseFrame(wx.Frame):
         self.redrawAll()
     
     def on_filt_button(self, event):
-        self.calc_filters()
-        self.redrawAll()
+        self.recalcScheduler.request()
     
     def on_recalc(self, event):
-        self.recalcAll()
-        self.redrawAll()
+        self.recalcData = True
+        self.recalcScheduler.request()
 
     def redrawAll(self, setZero=False):
         self.calc_figureLeft()
@@ -373,6 +410,7 @@ class MasseFrame(wx.Frame):
         self.calc_figureRightProtein()
         self.calc_lists()
         self.draw_all()
+        self.prefetchFits()
         if setZero:
             self.figLeft.tight_layout()
             self.figRight.tight_layout()
@@ -381,7 +419,7 @@ class MasseFrame(wx.Frame):
             
         
     def recalcAll(self):
-        self.calc_data()
+        self.recalcData = True
         self.calc_filters()
 
     def draw_all(self):
@@ -403,7 +441,7 @@ class MasseFrame(wx.Frame):
             pickedDataset = self.datasetsList.GetStringSelection()
             pickedUID = qMS.sort_nicely(list(self.dataFrame[(self.dataFrame[FILENAMEHEADER] == pickedDataset) & \
                                                        (self.dataFrame['allClear'] == True)][UIDHEADER].values))[0]            
-            self.currentRow = self.dataFrame[self.dataFrame[UIDHEADER] == pickedUID].iloc[0]
+            self.currentRow = self.uidIndex.row(pickedUID)
             self.resetFilterRanges()
             self.calc_filters()
             self.redrawAll()
@@ -411,13 +449,13 @@ class MasseFrame(wx.Frame):
     def on_savedBoxClick(self, event):
         if not (self.savedList.GetStringSelection() is u''):
             pickedUID = self.savedList.GetStringSelection()
-            self.currentRow = self.dataFrame[self.dataFrame[UIDHEADER] == pickedUID].iloc[0]
+            self.currentRow = self.uidIndex.row(pickedUID)
             self.newPepSelection()
         
     def on_filteredBoxClick(self, event):
         if not (self.filteredList.GetStringSelection() is u''):
             pickedUID = self.filteredList.GetStringSelection()
-            self.currentRow = self.dataFrame[self.dataFrame[UIDHEADER] == pickedUID].iloc[0]
+            self.currentRow = self.uidIndex.row(pickedUID)
             self.newPepSelection()
     
     def newPepSelection(self):
@@ -426,13 +464,20 @@ class MasseFrame(wx.Frame):
         self.canvasRight.draw()
         self.selectedPointDataset.set_data(self.currentRow['currentPosDataset'], self.currentRow['currentCalc'])
         self.canvasLeft.draw()
+        self.prefetchFits()
+
+    def prefetchFits(self):
+        uids = fitTraces.neighbourItems(self.savedListItems, self.currentRow[UIDHEADER], PREFETCHN) + \
+                fitTraces.neighbourItems(self.filteredListItems, self.currentRow[UIDHEADER], PREFETCHN)
+        self.fitPrefetcher.prefetch([self.uidIndex.row(u)[ISOFILEHEADER] for u in uids if u in self.uidIndex])
 
     def on_key_press(self, event):
         event.Skip()
+        self.recalcScheduler.flush(False)
         c = event.GetKeyCode()
         if c is 68: #got a d keystroke
-            self.dataFrame.loc[self.dataFrame[UIDHEADER] == self.currentRow[UIDHEADER],'handDelete'] = True
-            self.dataFrame.loc[self.dataFrame[UIDHEADER] == self.currentRow[UIDHEADER],'handSave'] = False
+            self.uidIndex.setValue(self.currentRow[UIDHEADER], 'handDelete', True)
+            self.uidIndex.setValue(self.currentRow[UIDHEADER], 'handSave', False)
             try:            
                 myIndex = list(self.savedListItems).index(self.currentRow[UIDHEADER])
             except ValueError:
@@ -441,19 +486,19 @@ class MasseFrame(wx.Frame):
                 nextItem = self.savedListItems[myIndex+1]
             except IndexError:
                 nextItem = self.savedListItems[myIndex-1]
-            self.currentRow = self.dataFrame[self.dataFrame[UIDHEADER] == nextItem].iloc[0]
+            self.currentRow = self.uidIndex.row(nextItem)
             self.calc_hand_filters()
             self.redrawAll()
             
         elif c is 83: # got a s keystroke
-            self.dataFrame.loc[self.dataFrame[UIDHEADER] == self.currentRow[UIDHEADER],'handDelete'] = False
-            self.dataFrame.loc[self.dataFrame[UIDHEADER] == self.currentRow[UIDHEADER],'handSave'] = True
+            self.uidIndex.setValue(self.currentRow[UIDHEADER], 'handDelete', False)
+            self.uidIndex.setValue(self.currentRow[UIDHEADER], 'handSave', True)
             self.calc_hand_filters()
             self.redrawAll()
             
         elif c is 69: # got a e keystroke (delete all)
-            self.dataFrame.loc[self.dataFrame['TID'] == self.currentRow['TID'], 'handDelete'] = True
-            self.dataFrame.loc[self.dataFrame['TID'] == self.currentRow['TID'], 'handSave'] = False
+            self.tidIndex.setValue(self.currentRow['TID'], 'handDelete', True)
+            self.tidIndex.setValue(self.currentRow['TID'], 'handSave', False)
             try:
                 myIndex = list(self.savedListItems).index(self.currentRow[UIDHEADER])
             except ValueError:
@@ -462,24 +507,21 @@ class MasseFrame(wx.Frame):
                 nextItem = self.savedListItems[myIndex+1]
             except IndexError:
                 nextItem = self.savedListItems[myIndex-1]
-            self.currentRow = self.dataFrame[self.dataFrame[UIDHEADER] == nextItem].iloc[0]
+            self.currentRow = self.uidIndex.row(nextItem)
             self.calc_hand_filters()
             self.redrawAll()
             
         elif c is 87: # got a w keystroke (save all)
-            self.dataFrame.loc[self.dataFrame['TID'] == self.currentRow['TID'], 'handDelete'] = False
-            self.dataFrame.loc[self.dataFrame['TID'] == self.currentRow['TID'], 'handSave'] = True
+            self.tidIndex.setValue(self.currentRow['TID'], 'handDelete', False)
+            self.tidIndex.setValue(self.currentRow['TID'], 'handSave', True)
             self.calc_hand_filters()
             self.redrawAll()
     
     def pickScatterPointDataset(self, event):
-        ind = event.ind
-        thisline = event.artist
-        ydata = thisline.get_ydata()
-        xdata = thisline.get_xdata()
-        self.currentRow = self.dataFrame[(self.dataFrame[FILENAMEHEADER] == self.currentRow[FILENAMEHEADER]) &\
-                                            (self.dataFrame['currentCalc'] == ydata[ind][0]) & \
-                                            ((self.dataFrame['currentPosDataset'] == xdata[ind][0]))].iloc[0]
+        rows = masseArtists.pickedRows(event)
+        if rows is None:
+            return
+        self.currentRow = self.uidIndex.row(rows[UIDHEADER].values[masseArtists.cyclePick(rows, UIDHEADER, self.currentRow[UIDHEADER])])
         self.selectedPointDataset.set_data(self.currentRow['currentPosDataset'], self.currentRow['currentCalc'])
         self.canvasLeft.draw()
         self.calc_figureRightFit()
@@ -487,18 +529,16 @@ class MasseFrame(wx.Frame):
         self.canvasRight.draw()
         self.savedList.SetStringSelection(self.currentRow[UIDHEADER])
         self.filteredList.SetStringSelection(self.currentRow[UIDHEADER])
+        self.prefetchFits()
         
     def pickScatterPointProtein(self, event):
-        ind = event.ind
-        thisline = event.artist
-        ydata = thisline.get_ydata()
-        xdata = thisline.get_xdata()
-        self.currentRow = self.dataFrame[(self.dataFrame[PROTEINHEADER] == self.currentRow[PROTEINHEADER]) & \
-                                            (self.dataFrame['currentCalc'] == ydata[ind][0]) & \
-                                            ((self.dataFrame['currentPosProtein'] == xdata[ind][0]))].iloc[0]
+        rows = masseArtists.pickedRows(event)
+        if rows is None:
+            return
+        self.currentRow = self.uidIndex.row(rows[UIDHEADER].values[masseArtists.cyclePick(rows, UIDHEADER, self.currentRow[UIDHEADER])])
         self.selectedPointProtein.set_data(self.currentRow['currentPosProtein'], self.currentRow['currentCalc'])
-        theRows = self.dataFrame[(self.dataFrame[PROTEINHEADER] == self.currentRow[PROTEINHEADER]) & \
-                                    (self.dataFrame['TID'] == self.currentRow['TID'])]
+        theRows = self.tidIndex.rows(self.currentRow['TID'])
+        theRows = theRows[theRows[PROTEINHEADER] == self.currentRow[PROTEINHEADER]]
         self.selectedPairedPointsProtein.set_data(theRows['currentPosProtein'], theRows['currentCalc'])
         self.resetFilterRanges()
         self.calc_filters()
@@ -517,41 +557,163 @@ class MasseFrame(wx.Frame):
         self.datasetsList.Set(self.datasetsListItems)
         self.datasetsList.SetStringSelection(self.currentRow[FILENAMEHEADER])
     
-    def calc_data(self):
-        self.calcNum = self.getChecksNum()
-        self.calcDen = self.getChecksDen()
-        self.dataFrame['currentCalc'] = qMS.calcValue(self.dataFrame, self.calcNum, self.calcDen)
-    
     def calc_filters(self):
-        rangeHash = self.findRanges()
-        curFile = self.currentRow[FILENAMEHEADER]
-        if not self.priorFilters.IsChecked():
-            self.dataFrame.loc[self.dataFrame[FILENAMEHEADER] == curFile, 'ppmDiff_pass'] = (self.dataFrame['ppmDiff'] >= rangeHash['ppmDiff_low']) & (self.dataFrame['ppmDiff'] <= rangeHash['ppmDiff_high'])
-            self.dataFrame.loc[self.dataFrame[FILENAMEHEADER] == curFile, 'ppm_n14_pass'] = (self.dataFrame['ppm_n14'] >= rangeHash['ppm_n14_low']) & (self.dataFrame['ppm_n14'] <= rangeHash['ppm_n14_high'])
-            self.dataFrame.loc[self.dataFrame[FILENAMEHEADER] == curFile, 'ppm_n15_pass'] = (self.dataFrame['ppm_n15'] >= rangeHash['ppm_n15_low']) & (self.dataFrame['ppm_n15'] <= rangeHash['ppm_n15_high'])
-            self.dataFrame.loc[self.dataFrame[FILENAMEHEADER] == curFile, 'resid_pass'] = self.dataFrame['resid'] <= rangeHash['resid']
-            self.dataFrame.loc[self.dataFrame[FILENAMEHEADER] == curFile, 'ratio_pass'] = (self.dataFrame['currentCalc'] >= rangeHash['ratio_low']) & (self.dataFrame['currentCalc'] <= rangeHash['ratio_high'])
-            self.dataFrame.loc[self.dataFrame[FILENAMEHEADER] == curFile, 'minInt_pass'] = self.dataFrame['minIntensity'] >= rangeHash['minInt']
-            self.dataFrame.loc[self.dataFrame[FILENAMEHEADER] == curFile, self.lastHistField+'_pass'] = (self.dataFrame[self.lastHistField] >= rangeHash[self.lastHistField+'_low']) & \
-                                                                                                        (self.dataFrame[self.lastHistField] <= rangeHash[self.lastHistField+'_high'])
-
-            self.dataFrame.loc[self.dataFrame[FILENAMEHEADER] == self.currentRow[FILENAMEHEADER], 'allFPass'] = self.dataFrame['ppmDiff_pass'] & \
-                                                                                                                self.dataFrame['ppm_n14_pass'] & \
-                                                                                                                self.dataFrame['ppm_n15_pass'] & \
-                                                                                                                self.dataFrame['resid_pass'] & \
-                                                                                                                self.dataFrame['ratio_pass'] & \
-                                                                                                                self.dataFrame['minInt_pass'] & \
-                                                                                                                self.dataFrame[self.lastHistField+'_pass']
+        self.recalcScheduler.runNow(False)
+
+    def gatherFilters(self):
+        """
+        Reads the widgets for computeFilters. The numerator/denominator checks
+        are only picked up when a recalculation of the data was asked for.
+        """
+        if self.recalcData:
+            calcNum = self.getChecksNum()
+            calcDen = self.getChecksDen()
         else:
-            self.dataFrame.loc[self.dataFrame[FILENAMEHEADER] == self.currentRow[FILENAMEHEADER], 'allFPass'] = self.dataFrame['priorFilter']
-    
-        self.dataFrame.loc[self.dataFrame[FILENAMEHEADER] == self.currentRow[FILENAMEHEADER], 'allClear'] = self.dataFrame['allFPass']
-        self.calc_hand_filters()
+            calcNum = None
+            calcDen = None
+        self.recalcData = False
+        return [calcNum, calcDen, self.findRanges(), self.currentRow[FILENAMEHEADER], self.lastHistField, 
+                self.priorFilters.IsChecked(), self.handDeleteOn.IsChecked(), self.handSaveOn.IsChecked()]
+
+    def computeFilters(self, inputs):
+        """
+        Filters the current dataset with the ranges from gatherFilters without
+        touching the dataFrame; applyFilters writes the result back. Only the
+        dataset's own rows (from datasetIndex) are compared, and only they get
+        the hand flags applied (the other datasets' allClear already has them)
+        unless the hand save/delete checks changed since the last pass.
+        """
+        [calcNum, calcDen, rangeHash, curFile, lastHistField, priorOn, handDeleteOn, handSaveOn] = inputs
+        if calcNum is None:
+            currentCalc = None
+            calcValues = self.dataFrame['currentCalc']
+        else:
+            currentCalc = qMS.calcValue(self.dataFrame, calcNum, calcDen)
+            calcValues = currentCalc
+        rows = self.datasetIndex.positions[curFile]
+        view = lambda col: self.dataFrame[col].values[rows]
+        passes = collections.OrderedDict()
+        if not priorOn:
+            passes['ppmDiff_pass'] = (view('ppmDiff') >= rangeHash['ppmDiff_low']) & (view('ppmDiff') <= rangeHash['ppmDiff_high'])
+            passes['ppm_n14_pass'] = (view('ppm_n14') >= rangeHash['ppm_n14_low']) & (view('ppm_n14') <= rangeHash['ppm_n14_high'])
+            passes['ppm_n15_pass'] = (view('ppm_n15') >= rangeHash['ppm_n15_low']) & (view('ppm_n15') <= rangeHash['ppm_n15_high'])
+            passes['resid_pass'] = view('resid') <= rangeHash['resid']
+            calcRows = numpy.asarray(calcValues)[rows]
+            passes['ratio_pass'] = (calcRows >= rangeHash['ratio_low']) & (calcRows <= rangeHash['ratio_high'])
+            passes['minInt_pass'] = view('minIntensity') >= rangeHash['minInt']
+            passes[lastHistField+'_pass'] = (view(lastHistField) >= rangeHash[lastHistField+'_low']) & \
+                                            (view(lastHistField) <= rangeHash[lastHistField+'_high'])
+            allFPass = reduce(lambda a, b: a & b, passes.values())
+        else:
+            allFPass = view('priorFilter')
+        handChecks = (handDeleteOn, handSaveOn)
+        if handChecks == self.handChecks:
+            clearRows = rows
+            allClear = self.handFilters(allFPass, handDeleteOn, handSaveOn, rows=rows)
+        else:
+            clearRows = None
+            allClear = self.dataFrame['allClear'].copy()
+            allClear.iloc[rows] = allFPass
+            allClear = self.handFilters(allClear, handDeleteOn, handSaveOn)
+        return [calcNum, calcDen, currentCalc, rows, passes, allFPass, handChecks, clearRows, allClear]
+
+    def applyFilters(self, result, redraw=True):
+        [calcNum, calcDen, currentCalc, rows, passes, allFPass, handChecks, clearRows, allClear] = result
+        if currentCalc is not None:
+            self.calcNum = calcNum
+            self.calcDen = calcDen
+            self.dataFrame['currentCalc'] = currentCalc
+        for (col, values) in passes.items() + [('allFPass', allFPass)]:
+            if not col in self.dataFrame.columns:
+                self.dataFrame[col] = numpy.nan
+            self.dataFrame.iloc[rows, self.dataFrame.columns.get_loc(col)] = values
+        if clearRows is None:
+            self.dataFrame['allClear'] = allClear
+        else:
+            self.dataFrame.iloc[clearRows, self.dataFrame.columns.get_loc('allClear')] = allClear
+        self.handChecks = handChecks
+        self.filterGeneration += 1
+        if redraw:
+            self.redrawAll()
+
+    def on_filterAll_button(self, event):
+        self.refilterAll()
+
+    def refilterAll(self):
+        """
+        Applies every dataset's stored ranges from filterRangeHash at once (the
+        same cuts as calc_filters, see masseFilter.datasetPasses), e.g. after
+        the values were recalculated.
+        """
+        self.findRanges()
+        with self.recalcScheduler.lock:
+            self.recalcScheduler.cancel()
+            if self.priorFilters.IsChecked():
+                allFPass = self.dataFrame['priorFilter'].values
+            else:
+                [passes, allFPass] = masseFilter.datasetPasses(self.dataFrame, self.filterRangeHash, FILENAMEHEADER,
+                                                               histField=self.lastHistField)
+                for (col, values) in passes.items():
+                    self.dataFrame[col] = values
+            self.dataFrame['allFPass'] = allFPass
+            self.dataFrame['allClear'] = self.handFilters(pandas.Series(allFPass, index=self.dataFrame.index),
+                                                          self.handDeleteOn.IsChecked(), self.handSaveOn.IsChecked())
+            self.handChecks = (self.handDeleteOn.IsChecked(), self.handSaveOn.IsChecked())
+            self.filterGeneration += 1
+        self.redrawAll()
+
+    def on_suggest_button(self, event):
+        self.suggestRanges(SUGGESTSIGMAS)
+        self.resetFilterRanges()
+        self.refilterAll()
+
+    def suggestRanges(self, sigmas):
+        """
+        Fills filterRangeHash for every dataset from robust (clipped median/MAD)
+        statistics of its own rows, in one grouped pass per column. resid only
+        gets an upper and minInt only a lower limit (found on a log scale); the
+        ratio limits are left alone, as they bound the measurement itself.
+        Limits are rounded outwards, and a column with no spread in a dataset
+        keeps its current limits there.
+        """
+        cuts = [(col, lowKey, highKey) for (passCol, col, lowKey, highKey) in masseFilter.DATASETFILTERS if col != 'currentCalc']
+        cuts.append((self.lastHistField, self.lastHistField+'_low', self.lastHistField+'_high'))
+        suggested = robustStats.groupedRanges(self.dataFrame, FILENAMEHEADER, [c[0] for c in cuts], sigmas, logCols=['minIntensity'])
+        for (dataset, ranges) in suggested.items():
+            #the initial ranges are one dict shared by every dataset
+            currHash = dict(self.filterRangeHash.get(dataset, {}))
+            for (col, lowKey, highKey) in cuts:
+                (low, high) = ranges[col]
+                if numpy.isnan(low):
+                    #nothing to go on in this dataset
+                    continue
+                scale = 10.0**(4 if col == 'resid' else 2)
+                if lowKey is not None:
+                    currHash[lowKey] = float(numpy.floor(low*scale)/scale)
+                if highKey is not None:
+                    currHash[highKey] = float(numpy.ceil(high*scale)/scale)
+            self.filterRangeHash[dataset] = currHash
+
+    def handFilters(self, allClear, handDeleteOn, handSaveOn, rows=None):
+        """
+        allClear with the hand flags applied. With rows (positions), allClear
+        holds just those rows and only their flags are read.
+        """
+        if rows is None:
+            [handDelete, handSave] = [self.dataFrame['handDelete'], self.dataFrame['handSave']]
+        else:
+            [handDelete, handSave] = [self.dataFrame['handDelete'].values[rows] == True, self.dataFrame['handSave'].values[rows] == True]
+        if handDeleteOn:
+            allClear = (allClear) & (~handDelete)
+        if handSaveOn:
+            allClear = (allClear) | (handSave)
+        return allClear
+
     def calc_hand_filters(self):
-        if self.handDeleteOn.IsChecked():
-            self.dataFrame['allClear'] = (self.dataFrame['allClear']) & (~self.dataFrame['handDelete'])
-        if self.handSaveOn.IsChecked():
-            self.dataFrame['allClear'] = (self.dataFrame['allClear']) | (self.dataFrame['handSave'])
+        with self.recalcScheduler.lock:
+            self.dataFrame['allClear'] = self.handFilters(self.dataFrame['allClear'], self.handDeleteOn.IsChecked(), self.handSaveOn.IsChecked())
+            self.handChecks = (self.handDeleteOn.IsChecked(), self.handSaveOn.IsChecked())
+            self.filterGeneration += 1
     def findRanges(self):
         currHash = {}
         (currHash['ppmDiff_low'], currHash['ppmDiff_high']) = map(float, self.ppmDiffRangeBypass.GetValue().split(' '))
@@ -564,26 +726,23 @@ class MasseFrame(wx.Frame):
         self.filterRangeHash[self.currentRow[FILENAMEHEADER]] = currHash.copy()
         return currHash
 
-    def determineMedians(self, view, field):
-        xs = list(set(view[field]))
-        ys = [view[view[field]==k]['currentCalc'].median() for k in xs]
-        xs = [float(i) for i in xs]
-        return [xs,ys]
+    def determineMedians(self, view, field, name):
+        return self.medianCache.get(view, field, (self.filterGeneration, name))
        
     def calc_figureLeft(self):
         self.PLPlotDataset.clear()
-        self.datasetView = self.dataFrame[self.dataFrame[FILENAMEHEADER] == self.currentRow[FILENAMEHEADER]]
+        self.datasetView = self.datasetIndex.rows(self.currentRow[FILENAMEHEADER])
         self.passDatasetView = self.datasetView[self.datasetView['allClear'] == True]
         self.failDatasetView = self.datasetView[self.datasetView['allClear'] == False]
 
         self.selectedPointDataset, = self.PLPlotDataset.plot(self.currentRow['currentPosDataset'], self.currentRow['currentCalc'], 
                                               'o', ms=20, alpha=0.5, color='yellow', visible=True)
         self.PLPlotDataset.grid(self.cb_grid.IsChecked())
-        self.PLPlotDataset.plot(self.passDatasetView['currentPosDataset'], self.passDatasetView['currentCalc'], 'ro', picker=5, label="Saved : " + str(len(self.passDatasetView['currentCalc'].values)))
-        meds = self.determineMedians(self.passDatasetView, 'currentPosDataset')
+        masseArtists.tagRows(self.PLPlotDataset.plot(self.passDatasetView['currentPosDataset'], self.passDatasetView['currentCalc'], 'ro', picker=5, label="Saved : " + str(len(self.passDatasetView['currentCalc'].values)))[0], self.passDatasetView)
+        meds = self.determineMedians(self.passDatasetView, 'currentPosDataset', self.currentRow[FILENAMEHEADER])
         self.PLPlotDataset.plot(meds[0], meds[1], 'g-', lw=2, label="Median : " + str(round(numpy.median(meds[1]),1)))
         if not self.hideCheck.IsChecked():
-            self.PLPlotDataset.plot(self.failDatasetView['currentPosDataset'], self.failDatasetView['currentCalc'], 'x', mec='grey', picker=5, label="Filtered : " + str(len(self.failDatasetView['currentCalc'].values)))
+            masseArtists.tagRows(self.PLPlotDataset.plot(self.failDatasetView['currentPosDataset'], self.failDatasetView['currentCalc'], 'x', mec='grey', picker=5, label="Filtered : " + str(len(self.failDatasetView['currentCalc'].values)))[0], self.failDatasetView)
         self.PLPlotDataset.set_xticks(range(1,int(self.dataFrame['currentPosDataset'].max())+1))
         self.PLPlotDataset.set_xticklabels(self.positionLabelsDataset, rotation=90, size='small')
         self.PLPlotDataset.set_title(self.currentRow[FILENAMEHEADER] + " : " + setCurrentFrac(self.calcNum, self.calcDen))
@@ -623,17 +782,13 @@ class MasseFrame(wx.Frame):
             vizLib.cleanAxis(hists[curHist])
     
     def calc_figureRightFit(self):
-        plotsfile = self.datapath+self.currentRow[ISOFILEHEADER]+'.plots'
-        txtfile = self.datapath+self.currentRow[ISOFILEHEADER]+'.txt'
-        df = pandas.read_csv(plotsfile)
-        df2 = pandas.read_csv(txtfile, header=None, sep=' ')
-        del df['residAdj']
+        trace = self.fitCache.get(self.currentRow[ISOFILEHEADER])
         self.PNGPlot.clear()
-        self.PNGPlot.plot(df2[0][0:len(df['dat'])].values, df['dat'].values, 'o', markersize=6, markerfacecolor='None', markeredgecolor='red')
-        self.PNGPlot.plot(df2[0][0:len(df['dat'])].values, df['dat'].values, 'r-', linewidth=2, label='data')
-        self.PNGPlot.plot(df2[0][0:len(df['fit'])].values, df['fit'].values, 'b-', linewidth=2, label='fit')
-        self.PNGPlot.plot(df2[0][0:len(df['resid'])].values, df['resid'].values, 'g-', linewidth=2, label='residual')
-        self.PNGPlot.set_xlim(df2[0][0:len(df['dat'])].values.min(), df2[0][0:len(df['dat'])].values.max())
+        self.PNGPlot.plot(trace['mz'], trace['dat'], 'o', markersize=6, markerfacecolor='None', markeredgecolor='red')
+        self.PNGPlot.plot(trace['mz'], trace['dat'], 'r-', linewidth=2, label='data')
+        self.PNGPlot.plot(trace['mz'], trace['fit'], 'b-', linewidth=2, label='fit')
+        self.PNGPlot.plot(trace['mz'], trace['resid'], 'g-', linewidth=2, label='residual')
+        self.PNGPlot.set_xlim(trace['mz'].min(), trace['mz'].max())
         self.PNGPlot.legend()
         stringColor = 'black'
         row = self.currentRow
@@ -684,11 +839,11 @@ class MasseFrame(wx.Frame):
         self.selectedPointProtein, = self.PLPlotProtein.plot(self.currentRow['currentPosProtein'], self.currentRow['currentCalc'], 
                                               'o', ms=20, alpha=0.5, color='yellow', visible=True)
         
-        self.PLPlotProtein.plot(self.passProteinView['currentPosProtein'], self.passProteinView['currentCalc'], 'ro', picker=5, label="Saved : " + str(len(self.passProteinView['currentCalc'].values)))
-        meds = self.determineMedians(self.passProteinView, 'currentPosProtein')
+        masseArtists.tagRows(self.PLPlotProtein.plot(self.passProteinView['currentPosProtein'], self.passProteinView['currentCalc'], 'ro', picker=5, label="Saved : " + str(len(self.passProteinView['currentCalc'].values)))[0], self.passProteinView)
+        meds = self.determineMedians(self.passProteinView, 'currentPosProtein', self.currentRow[PROTEINHEADER])
         self.PLPlotProtein.plot(meds[0], meds[1], 'g-', lw=2, label="Median : " + str(round(numpy.median(meds[1]),1)))
         if not self.hideCheck.IsChecked():
-            self.PLPlotProtein.plot(self.failProteinView['currentPosProtein'], self.failProteinView['currentCalc'], 'x', mec='grey', picker=5, label="Filtered : " + str(len(self.failProteinView['currentCalc'].values)))
+            masseArtists.tagRows(self.PLPlotProtein.plot(self.failProteinView['currentPosProtein'], self.failProteinView['currentCalc'], 'x', mec='grey', picker=5, label="Filtered : " + str(len(self.failProteinView['currentCalc'].values)))[0], self.failProteinView)
         self.PLPlotProtein.grid(self.cb_grid.IsChecked())        
         self.PLPlotProtein.set_xticks(range(1,int(self.dataFrame['currentPosProtein'].max())+1))
         self.PLPlotProtein.set_xticklabels(self.positionLabelsProtein, rotation=30, size='small')
@@ -734,12 +889,15 @@ def transformValue(inputData, transformData, toTransform, normalizeTo):
     inputTransformed = inputNormOffset*float(inputData.loc[normalizeTo])
     return inputTransformed
 
-def openFile(fullpath):
-    r = csv.reader(open(fullpath))
-    header = r.next()
-    dataFrame = qMS.readIsoCSV(fullpath, noProcess=False)
-    puls = 'AMP_L' in dataFrame.columns
-    vla = 'FRC_NX' in dataFrame.columns
+def openFile(fullpath, compact=False):
+    """
+    compact stores the filter measures as float32 and the protein/shortName/TID
+    columns as categoricals (see compactFrame.py). Every column is kept, as
+    the export writes the whole frame back out.
+    """
+    [dataFrame, puls, vla] = masseFilter.openIsoFile(fullpath, merged=True)
+    if compact:
+        compactFrame.compactLoaded(dataFrame)
     return [dataFrame, puls, vla]
 
 def startApp(dataFrame, datapath, filename, pulse, varLab, fsize=None, size=None):
@@ -758,7 +916,7 @@ def startApp(dataFrame, datapath, filename, pulse, varLab, fsize=None, size=None
     app.frame.Show()
     app.MainLoop()    
 
-def fileOpenStart(pathToFile=None):
+def fileOpenStart(pathToFile=None, compact=False):
         """
         Create and show the Open FileDialog
         """
@@ -780,7 +938,7 @@ def fileOpenStart(pathToFile=None):
         dp = '/'.join(hold.split('/')[:-1])+'/'
         fn = hold.split('/')[-1]
         print "opening file : " + pathToFile + "..."
-        [df, p, vl] = openFile(pathToFile)
+        [df, p, vl] = openFile(pathToFile, compact=compact)
         return [df, dp, fn, p, vl]
         frame.Destroy()
         app.Destroy()
@@ -794,6 +952,8 @@ if __name__ == '__main__':
     #pathToFile = '/home/jhdavis/data/compiledDeps/L17Unfilt/L17_1FractionListMergedNew_iso_res.csv'
     fsize=None
     size=None
-    [dfr, dpa, fna, pul, vlab] = fileOpenStart(pathToFile)
+    #compact=True shrinks the memory of large merged datasets (float32 and categorical columns)
+    compact=False
+    [dfr, dpa, fna, pul, vlab] = fileOpenStart(pathToFile, compact=compact)
     
     startApp(dfr, dpa, fna, pul, vlab, fsize=fsize, size=size)
\ No newline at end of file
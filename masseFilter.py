@@ -0,0 +1,595 @@
+# -*- coding: utf-8 -*-
+"""
+Headless version of the masse.py filters. Applies the cuts stored in a
+.filterParam file (as written by MasseFrame.savePs) to an _iso_res.csv and
+writes the _filt.csv that the Export button would have produced.
+
+usage : python masseFilter.py params.filterParam a_iso_res.csv [b_iso_res.csv ...]
+
+Merged datasets filtered per fraction in masseESIGroup can be re-filtered
+with the per fraction ranges saved by its Export button:
+
+usage : python masseFilter.py merged_iso_res_filt.filterRanges merged_iso_res.csv
+
+--cache (anywhere on the command line) loads the inputs through the binary
+sidecar cache of isoCache.py, writing one next to each input that has none.
+"""
+
+import qMS
+import isoCache
+import csv
+import copy
+import shutil
+import sys
+import collections
+import numpy
+import pandas
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+#frames of at least this many rows are masked with numexpr; None never picks it.
+#filterBenchmark.py found the in place numpy kernel faster at 100k, 1M and 5M
+#rows, so set this only from a benchmark on the target machine
+NUMEXPRMINROWS = None
+#numexpr compiles expressions of at most this many variables
+NUMEXPRMAXINPUTS = 32
+
+#SortedColumnIndex masks are only used for ranges holding at most this fraction
+#of the rows; scattering a wider slice is slower than scanning the column
+#(the two cross at about 0.3 on 1M rows)
+INDEXMAXFRACTION = 0.2
+
+#(dataFrame column, low key, high key, on/off key) as stored in a .filterParam
+FILTERPARAMS = [('ppmDiff', 'ppmDiff_low', 'ppmDiff_high', 'ppmDiff'),
+                ('ppm_n14', 'ppm_n14_low', 'ppm_n14_high', 'n14'),
+                ('ppm_n15', 'ppm_n15_low', 'ppm_n15_high', 'n15'),
+                ('missed', 'missed_low', 'missed_high', 'missed'),
+                ('rtDiff', 'rtDiff_low', 'rtDiff_high', 'rtDiff'),
+                ('resid', 'resid_low', 'resid_high', 'resid'),
+                ('ratio', 'ratio_low', 'ratio_high', 'ratio'),
+                ('GW', 'GW_low', 'GW_high', 'GW'),
+                ('minIntensity', 'minIntensity', None, 'minIntensityOn'),
+                ('FRC_NX', 'FRC_NX_low', 'FRC_NX_high', 'FRC_NX')]
+FILTERCOLUMNS = [i[0] for i in FILTERPARAMS]
+
+#(pass column, dataFrame column, low key, high key) of the per dataset ranges in masseESIGroup's filterRangeHash
+DATASETFILTERS = [('ppmDiff_pass', 'ppmDiff', 'ppmDiff_low', 'ppmDiff_high'),
+                  ('ppm_n14_pass', 'ppm_n14', 'ppm_n14_low', 'ppm_n14_high'),
+                  ('ppm_n15_pass', 'ppm_n15', 'ppm_n15_low', 'ppm_n15_high'),
+                  ('resid_pass', 'resid', None, 'resid'),
+                  ('ratio_pass', 'currentCalc', 'ratio_low', 'ratio_high'),
+                  ('minInt_pass', 'minIntensity', 'minInt', None)]
+
+NUMCHECKS = [('lowNum', 'AMP_U'), ('midNum', 'AMP_L'), ('highNum', 'AMP_S')]
+DENCHECKS = [('lowDen', 'AMP_U'), ('midDen', 'AMP_L'), ('highDen', 'AMP_S')]
+#dataset name under which a .filterRanges file keeps the numerator/denominator checks
+CALCROWS = '#calcFraction'
+
+def readFilterParams(path):
+    f = open(path, 'r')
+    pdict = {}
+    for l in csv.reader(f):
+        pdict[l[0]] = l[1]
+    f.close()
+    return pdict
+
+def parseFilterParams(pdict, varLab=True):
+    """
+    Turns a filterParam dictionary (all strings) into a filter spec:
+    {'ranges':{column:(low, high)}, 'active':[columns], 'handSave':bool, 'handDelete':bool}
+    """
+    spec = {'ranges':{}, 'active':[], 'handSave':False, 'handDelete':False}
+    for (col, lowKey, highKey, onKey) in FILTERPARAMS:
+        if not lowKey in pdict or (col == 'FRC_NX' and not varLab):
+            continue
+        if highKey is None:
+            spec['ranges'][col] = (float(pdict[lowKey]), numpy.inf)
+        else:
+            spec['ranges'][col] = (float(pdict[lowKey]), float(pdict[highKey]))
+        if qMS.boolParse(pdict.get(onKey, 'False')):
+            spec['active'].append(col)
+    spec['handSave'] = qMS.boolParse(pdict.get('handSaveOn', 'False'))
+    spec['handDelete'] = qMS.boolParse(pdict.get('handDeleteOn', 'False'))
+    return spec
+
+def getCalcFractions(pdict, pulse=False):
+    calcNum = [iso for (key, iso) in NUMCHECKS if key in pdict and qMS.boolParse(pdict[key]) and (pulse or iso != 'AMP_L')]
+    calcDen = [iso for (key, iso) in DENCHECKS if key in pdict and qMS.boolParse(pdict[key]) and (pulse or iso != 'AMP_L')]
+    return [calcNum, calcDen]
+
+def inRange(dataFrame, col, limits):
+    return (dataFrame[col] >= limits[0]) & (dataFrame[col] <= limits[1])
+
+def numericValues(dataFrame, col):
+    values = dataFrame[col].values
+    if values.dtype.kind not in 'fiu':
+        #bool/object flags (handSave etc.) become 1.0/0.0, NaN stays NaN
+        values = values.astype(float)
+    return values
+
+def normalizeMinIntensity(dataFrame):
+    """
+    Sets the +-inf and NaN minIntensity of failed fits to 0 in place, as
+    masseESIGroup does on load, so they are tested against minInt like any
+    other row.
+    """
+    dataFrame['minIntensity'].replace([-numpy.inf, numpy.inf], numpy.nan, inplace=True)
+    dataFrame['minIntensity'].fillna(0, inplace=True)
+
+def fusedMask(dataFrame, steps, useNumexpr=None):
+    """
+    Evaluates a chain of range cuts in one pass without the temporary Series
+    that chained pandas comparisons allocate. steps is a list of
+    (op, column, low, high) applied left to right, where op is 'and' or 'or'
+    (the op of the first step is ignored); a step is true where
+    low <= column <= high. Uses numpy comparisons written in place into three
+    preallocated buffers. useNumexpr=True evaluates the chain with numexpr
+    instead, if it is installed; None does so only for frames of at least
+    NUMEXPRMINROWS rows.
+    """
+    if useNumexpr is None:
+        useNumexpr = NUMEXPRMINROWS is not None and len(dataFrame) >= NUMEXPRMINROWS
+    if numexpr is not None and useNumexpr:
+        filt = numexprMask(dataFrame, steps)
+        if filt is not None:
+            return filt
+
+    filt = numpy.empty(len(dataFrame), dtype=bool)
+    term = numpy.empty(len(dataFrame), dtype=bool)
+    tmp = numpy.empty(len(dataFrame), dtype=bool)
+    #NaNs compare False, which is what the filters want
+    with numpy.errstate(invalid='ignore'):
+        for (i, (op, col, low, high)) in enumerate(steps):
+            values = numericValues(dataFrame, col)
+            numpy.greater_equal(values, low, out=term)
+            numpy.less_equal(values, high, out=tmp)
+            numpy.logical_and(term, tmp, out=term)
+            if i == 0:
+                filt[:] = term
+            elif op == 'and':
+                numpy.logical_and(filt, term, out=filt)
+            else:
+                numpy.logical_or(filt, term, out=filt)
+    return filt
+
+def numexprMask(dataFrame, steps):
+    """
+    fusedMask's chain as a single numexpr expression. Columns and bounds are
+    passed as variables, so the compiled expression is reused when only the
+    limits change. Returns None if the chain needs more inputs than numexpr
+    takes.
+    """
+    expr = ''
+    names = {}
+    local = {}
+    def name(key, value):
+        if not key in names:
+            names[key] = 'v%d' % len(names)
+            local[names[key]] = value
+        return names[key]
+    for (i, (op, col, low, high)) in enumerate(steps):
+        v = name(('col', col), numericValues(dataFrame, col))
+        cuts = []
+        #an infinite bound only drops NaNs
+        for (bound, cmp) in [(low, '>='), (high, '<=')]:
+            if numpy.isinf(bound):
+                cuts.append('(%s == %s)' % (v, v))
+            else:
+                cuts.append('(%s %s %s)' % (v, cmp, name(('bound', float(bound)), numpy.float64(bound))))
+        term = '(' + ' & '.join(cuts) + ')'
+        if i == 0:
+            expr = term
+        else:
+            expr = '(' + expr + (' & ' if op == 'and' else ' | ') + term + ')'
+    if len(local) > NUMEXPRMAXINPUTS:
+        return None
+    return numexpr.evaluate(expr, local_dict=local)
+
+class SortedColumnIndex(object):
+    """
+    argsort of each filter column, built once per dataFrame. A [low, high]
+    range is then a contiguous slice of the sort order found by binary search,
+    which gives the number of rows in range without touching the column and a
+    mask by scattering just that slice. NaNs sort last and are never in range.
+    Building it sorts every column, so it only pays off when the filters are
+    narrowed repeatedly on a large frame.
+    """
+    def __init__(self, dataFrame, cols=None):
+        if cols is None:
+            cols = [c for c in FILTERCOLUMNS if c in dataFrame.columns]
+        self.nrows = len(dataFrame)
+        self.order = {}
+        self.sortedValues = {}
+        for col in cols:
+            values = dataFrame[col].values.astype(float)
+            self.order[col] = numpy.argsort(values, kind='mergesort')
+            self.sortedValues[col] = values[self.order[col]]
+
+    def __contains__(self, col):
+        return col in self.order
+
+    def rangeSlice(self, col, limits):
+        return (numpy.searchsorted(self.sortedValues[col], limits[0], side='left'),
+                numpy.searchsorted(self.sortedValues[col], limits[1], side='right'))
+
+    def count(self, col, limits):
+        (i, j) = self.rangeSlice(col, limits)
+        return max(j-i, 0)
+
+    def mask(self, col, limits):
+        (i, j) = self.rangeSlice(col, limits)
+        m = numpy.zeros(self.nrows, dtype=bool)
+        m[self.order[col][i:j]] = True
+        return m
+
+class RowIndex(object):
+    """
+    Hash index from the values of key (isofile, UID, TID, ...) to row positions
+    in dataFrame, so the selection handlers don't scan the whole frame. The
+    positions stay valid across in place edits such as hand save/delete, which
+    never add or remove rows.
+    """
+    def __init__(self, dataFrame, key):
+        self.dataFrame = dataFrame
+        self.key = key
+        self.positions = dataFrame.groupby(key, sort=False).indices
+
+    def __contains__(self, value):
+        return value in self.positions
+
+    def rows(self, value):
+        return self.dataFrame.iloc[self.positions.get(value, numpy.array([], dtype=int))]
+
+    def row(self, value):
+        return self.dataFrame.iloc[self.positions[value][0]]
+
+    def setValue(self, value, col, newValue):
+        self.dataFrame.iloc[self.positions[value], self.dataFrame.columns.get_loc(col)] = newValue
+
+class HandOverlay(object):
+    """
+    handSave/handDelete of every row as boolean arrays by row position, so
+    hand curating a fit is a couple of element writes. saved is
+    handSave == True and kept is handDelete == False, as the filters test them.
+    """
+    def __init__(self, dataFrame):
+        self.dataFrame = dataFrame
+        self.saved = (dataFrame['handSave'] == True).values
+        self.kept = (dataFrame['handDelete'] == False).values
+
+    def setRows(self, positions, save, delete):
+        """
+        Also writes the flags through to the dataFrame columns, which are what
+        gets exported.
+        """
+        self.saved[positions] = save
+        self.kept[positions] = not delete
+        #element by element, a vector .iloc write costs milliseconds on a large frame
+        (saveCol, deleteCol) = [self.dataFrame.columns.get_loc(c) for c in ['handSave', 'handDelete']]
+        for p in positions:
+            self.dataFrame.iat[p, saveCol] = save
+            self.dataFrame.iat[p, deleteCol] = delete
+
+class FilterState(object):
+    """
+    Pass masks for one dataFrame, cached per criterion. Each range cut is only
+    recomputed when its limits change, and the combined mask only when the spec
+    does, so toggling a single filter costs one column comparison. Hand
+    save/delete go through setHand, which only touches the rows concerned;
+    call invalidate after editing any other columns in place. Range cuts on
+    columns covered by index (a SortedColumnIndex) are resolved through it
+    instead of a scan when they hold at most INDEXMAXFRACTION of the rows.
+    """
+    def __init__(self, dataFrame, index=None):
+        self.dataFrame = dataFrame
+        self.index = index
+        self.masks = {}
+        self.limits = {}
+        self.hand = None
+        self.lastSpec = None
+        self.lastBase = None
+        self.lastMask = None
+
+    def invalidate(self, cols=None):
+        if cols is None:
+            cols = self.masks.keys() + ['handSave', 'handDelete']
+        for col in cols:
+            self.masks.pop(col, None)
+            self.limits.pop(col, None)
+        if 'handSave' in cols or 'handDelete' in cols:
+            self.hand = None
+        self.lastSpec = None
+
+    def handOverlay(self):
+        if self.hand is None:
+            self.hand = HandOverlay(self.dataFrame)
+        return self.hand
+
+    def setHand(self, positions, save, delete):
+        """
+        Hand saves/deletes the rows at positions and flips just those rows of
+        the cached pass mask. Returns the updated mask, or None if there is no
+        current one.
+        """
+        hand = self.handOverlay()
+        hand.setRows(positions, save, delete)
+        if self.lastSpec is None:
+            return None
+        filt = self.lastBase[positions]
+        if self.lastSpec['handSave']:
+            filt = filt | hand.saved[positions]
+        if self.lastSpec['handDelete']:
+            filt = filt & hand.kept[positions]
+        self.lastMask[positions] = filt
+        return self.lastMask
+
+    def criterionMask(self, col, limits, key=None):
+        if key is None:
+            key = col
+        if self.limits.get(key) != limits:
+            if self.index is not None and col in self.index and \
+                    self.index.count(col, limits) <= INDEXMAXFRACTION*self.index.nrows:
+                self.masks[key] = self.index.mask(col, limits)
+            else:
+                self.masks[key] = fusedMask(self.dataFrame, [('and', col, limits[0], limits[1])])
+            self.limits[key] = limits
+        return self.masks[key]
+
+    def getPassMask(self, spec):
+        if spec == self.lastSpec:
+            return self.lastMask
+        if 'ppmDiff' in spec['active']:
+            #the ppmDiff cut replaces the base mask rather than anding with it (as in MasseFrame)
+            filt = self.criterionMask('ppmDiff', spec['ranges']['ppmDiff']).copy()
+        else:
+            filt = self.criterionMask('missed', (-1, numpy.inf), key='base').copy()
+        for col in FILTERCOLUMNS[1:]:
+            if col in spec['active']:
+                filt &= self.criterionMask(col, spec['ranges'][col])
+        self.lastBase = filt.copy()
+        if spec['handSave']:
+            filt |= self.handOverlay().saved
+        if spec['handDelete']:
+            filt &= self.handOverlay().kept
+        self.lastSpec = copy.deepcopy(spec)
+        self.lastMask = filt
+        return filt
+
+    def rangeCount(self, col, limits):
+        if self.index is not None and col in self.index:
+            return self.index.count(col, limits)
+        return int(self.criterionMask(col, limits).sum())
+
+    def getPass(self, spec, t):
+        filt = self.getPassMask(spec)
+        if t:
+            return self.dataFrame[filt]
+        else:
+            return self.dataFrame[~filt]
+
+def passSteps(spec):
+    """
+    The fusedMask steps equivalent to a filter spec.
+    """
+    if 'ppmDiff' in spec['active']:
+        #the ppmDiff cut replaces the base mask rather than anding with it (as in MasseFrame)
+        steps = [('and', 'ppmDiff') + tuple(spec['ranges']['ppmDiff'])]
+    else:
+        steps = [('and', 'missed', -1, numpy.inf)]
+    for col in FILTERCOLUMNS[1:]:
+        if col in spec['active']:
+            steps.append(('and', col) + tuple(spec['ranges'][col]))
+    if spec['handSave']:
+        steps.append(('or', 'handSave', 1, 1))
+    if spec['handDelete']:
+        steps.append(('and', 'handDelete', 0, 0))
+    return steps
+
+def chainedPassMask(dataFrame, spec):
+    """
+    The original chained pandas evaluation, kept as the reference for
+    filterBenchmark.py.
+    """
+    filt = dataFrame['missed'] >= -1
+    if 'ppmDiff' in spec['active']:
+        filt = inRange(dataFrame, 'ppmDiff', spec['ranges']['ppmDiff'])
+    for col in FILTERCOLUMNS[1:]:
+        if col in spec['active']:
+            filt = filt & inRange(dataFrame, col, spec['ranges'][col])
+    if spec['handSave']:
+        filt = filt | (dataFrame['handSave'] == True)
+    if spec['handDelete']:
+        filt = filt & (dataFrame['handDelete'] == False)
+    return filt.values
+
+def getPassMask(dataFrame, spec):
+    return fusedMask(dataFrame, passSteps(spec))
+
+def getPass(dataFrame, spec, t):
+    filt = getPassMask(dataFrame, spec)
+    if t:
+        return dataFrame[filt]
+    else:
+        return dataFrame[~filt]
+
+def readRangeHash(path):
+    """
+    Reads a {dataset:{key:value}} range hash written by writeRangeHash.
+    Returns [rangeHash, calcChecks], calcChecks the numerator/denominator
+    checks as a filterParam style dictionary for getCalcFractions (empty for
+    files saved without them).
+    """
+    f = open(path, 'r')
+    rangeHash = collections.OrderedDict()
+    r = csv.reader(f)
+    r.next()
+    for l in r:
+        rangeHash.setdefault(l[0], {})[l[1]] = float(l[2])
+    f.close()
+    calcChecks = dict([(k, str(v == 1)) for (k, v) in rangeHash.pop(CALCROWS, {}).items()])
+    return [rangeHash, calcChecks]
+
+def writeRangeHash(path, rangeHash, calcFractions=None):
+    """
+    calcFractions ([calcNum, calcDen]) is stored with the ranges as rows of
+    the CALCROWS dataset, so the ratio cuts are re-applied to the same fraction.
+    """
+    f = open(path, 'w')
+    w = csv.writer(f)
+    w.writerow(['dataset', 'key', 'value'])
+    for dataset in sorted(rangeHash.keys()):
+        for key in sorted(rangeHash[dataset].keys()):
+            w.writerow([dataset, key, repr(rangeHash[dataset][key])])
+    if calcFractions is not None:
+        for (checks, isos) in [(NUMCHECKS, calcFractions[0]), (DENCHECKS, calcFractions[1])]:
+            for (key, iso) in checks:
+                w.writerow([CALCROWS, key, repr(1.0 if iso in isos else 0.0)])
+    f.close()
+
+def rangeHistField(rangeHash):
+    """
+    The extra histogram field (rtDiff, FRC_NX, ...) whose ranges are stored
+    in rangeHash besides the DATASETFILTERS ones, or None.
+    """
+    known = set([k for f in DATASETFILTERS for k in f[2:] if k is not None])
+    fields = set([k[:-len('_low')] for ranges in rangeHash.values() for k in ranges if k.endswith('_low') and not k in known])
+    if len(fields) > 1:
+        raise ValueError('ranges stored for more than one extra field : ' + ', '.join(sorted(fields)))
+    return fields.pop() if len(fields) > 0 else None
+
+def datasetPasses(dataFrame, rangeHash, datasetField, histField=None, calcValues=None):
+    """
+    Applies every dataset's own ranges from rangeHash ({dataset:{key:value}},
+    as masseESIGroup.filterRangeHash) in one pass: each limit is broadcast to
+    the rows through the dataset codes, so every cut is a single comparison
+    over the whole frame. A missing key leaves that side of the cut open;
+    rows of a dataset with no ranges at all fail. calcValues defaults to
+    currentCalc. Returns [passes, allFPass], passes an OrderedDict of pass
+    column:mask.
+    """
+    (codes, datasets) = pandas.factorize(dataFrame[datasetField])
+    def limits(key, default):
+        table = []
+        for d in datasets:
+            if not d in rangeHash:
+                table.append(numpy.nan)
+            elif key is None:
+                table.append(default)
+            else:
+                table.append(rangeHash[d].get(key, default))
+        #the extra NaN entry is picked up by rows without a dataset (code -1)
+        return numpy.array(table + [numpy.nan], dtype=float)[codes]
+    filters = list(DATASETFILTERS)
+    if histField is not None:
+        filters.append((histField+'_pass', histField, histField+'_low', histField+'_high'))
+    passes = collections.OrderedDict()
+    for (passCol, col, lowKey, highKey) in filters:
+        if col == 'currentCalc' and calcValues is not None:
+            values = numpy.asarray(calcValues, dtype=float)
+        else:
+            values = numericValues(dataFrame, col)
+        passes[passCol] = (values >= limits(lowKey, -numpy.inf)) & (values <= limits(highKey, numpy.inf))
+    allFPass = reduce(lambda a, b: a & b, passes.values())
+    return [passes, allFPass]
+
+def refilterIsoFile(isoPath, rangePath, outPath=None, datasetField='shortName', handDelete=True, handSave=True, useCache=False):
+    """
+    Re-filters every dataset of a merged _iso_res.csv with the per dataset
+    ranges in rangePath and writes it to outPath (default <isoPath>_filt.csv)
+    with the pass columns, allFPass/priorFilter and allClear set as
+    masseESIGroup's Export button does, from the frame masseESIGroup loads
+    (see loadMergedIsoFile). currentCalc is recalculated from the
+    numerator/denominator saved with the ranges, if any. useCache goes
+    through the sidecar cache of isoCache.py (and writes one if there is none).
+    """
+    [rangeHash, calcChecks] = readRangeHash(rangePath)
+    [dataFrame, pulse, varLab] = openIsoFile(isoPath, useCache=useCache, merged=True)
+    normalizeMinIntensity(dataFrame)
+    calcValues = None
+    if len(calcChecks) > 0:
+        [calcNum, calcDen] = getCalcFractions(calcChecks, pulse=pulse)
+        dataFrame['currentCalc'] = qMS.calcValue(dataFrame, calcNum, calcDen)
+        calcValues = dataFrame['currentCalc'].values
+    [passes, allFPass] = datasetPasses(dataFrame, rangeHash, datasetField, histField=rangeHistField(rangeHash),
+                                       calcValues=calcValues)
+    for (col, values) in passes.items():
+        dataFrame[col] = values
+    allClear = allFPass.copy()
+    if handDelete and 'handDelete' in dataFrame.columns:
+        allClear &= ~(dataFrame['handDelete'] == True).values
+    if handSave and 'handSave' in dataFrame.columns:
+        allClear |= (dataFrame['handSave'] == True).values
+    dataFrame['allFPass'] = allFPass
+    dataFrame['priorFilter'] = allFPass
+    dataFrame['allClear'] = allClear
+    if outPath is None:
+        outPath = isoPath[:-4]+'_filt.csv'
+    dataFrame.to_csv(outPath, index=False)
+    return dataFrame
+
+def loadIsoFile(fullpath):
+    r = csv.reader(open(fullpath))
+    header = r.next()
+
+    if not ('resid' in header and 'minIntensity' in header and 'ratio' in header and 'currentCalc' in header):
+        print "preprocesing : " + fullpath + "..."
+        return qMS.preProcessIsoCSV(fullpath, True)
+    else:
+        return qMS.readIsoCSV(fullpath, noProcess=False)
+
+def loadMergedIsoFile(fullpath):
+    """
+    masseESIGroup's loader: merged files are always read as preprocessed.
+    """
+    return qMS.readIsoCSV(fullpath, noProcess=False)
+
+def openIsoFile(fullpath, useCache=True, merged=False):
+    """
+    Loads an _iso_res.csv as masse.py does, or as masseESIGroup does with
+    merged. Each loader has a cache of its own.
+    """
+    (loader, name) = (loadMergedIsoFile, 'merged') if merged else (loadIsoFile, 'iso')
+    if useCache:
+        dataFrame = isoCache.cachedLoad(fullpath, loader, name)
+    else:
+        dataFrame = loader(fullpath)
+
+    puls = 'AMP_L' in dataFrame.columns
+    vla = 'FRC_NX' in dataFrame.columns
+    return [dataFrame, puls, vla]
+
+def filterIsoFile(isoPath, paramPath, outPath=None, useCache=False):
+    """
+    Filters a single _iso_res.csv and writes the saved points to outPath
+    (default <isoPath>_filt.csv) along with a copy of the .filterParam used.
+    useCache is as for refilterIsoFile.
+    """
+    pdict = readFilterParams(paramPath)
+    [dataFrame, pulse, varLab] = openIsoFile(isoPath, useCache=useCache)
+    [calcNum, calcDen] = getCalcFractions(pdict, pulse=pulse)
+    dataFrame['currentCalc'] = qMS.calcValue(dataFrame, calcNum, calcDen)
+    savedPoints = getPass(dataFrame, parseFilterParams(pdict, varLab=varLab), True)
+    if outPath is None:
+        outPath = isoPath[:-4]+'_filt.csv'
+    savedPoints.to_csv(outPath, index=False)
+    shutil.copyfile(paramPath, outPath[:-4]+'.filterParam')
+    return savedPoints
+
+if __name__ == '__main__':
+    args = [a for a in sys.argv[1:] if a != '--cache']
+    useCache = len(args) < len(sys.argv[1:])
+    paramPath = str(args[0])
+    if paramPath.endswith('.filterRanges'):
+        for f in args[1:]:
+            print 're-filtering every dataset in ' + f
+            sys.stdout.flush()
+            refiltered = refilterIsoFile(f, paramPath, useCache=useCache)
+            print '\tsaved ' + str(int(refiltered['allClear'].sum())) + ' of ' + str(len(refiltered)) + ' fits'
+        sys.exit()
+    for f in args[1:]:
+        print 'filtering ' + f
+        sys.stdout.flush()
+        saved = filterIsoFile(f, paramPath, useCache=useCache)
+        print '\tsaved ' + str(len(saved)) + ' fits'
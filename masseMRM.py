@@ -9,6 +9,11 @@ import numpy
 import sys
 import matplotlib.gridspec as gridspec
 import vizLib
+import masseStats
+import masseFilter
+import masseArtists
+import masseScheduler
+import compactFrame
 import matplotlib
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_wxagg import \
@@ -23,6 +28,16 @@ COLORMAP = pylab.cm.jet
 TITLE = 'Masse MRM'
 ZOOMMAX = 5
 FILENAMEHEADER = 'Replicate Name'
+FILTERCHECKS = ['PPMtranLHOn', 'PPMtranTRANALLOn', 'PPMdsLOn', 'PPMdsHOn', 'RTdsLHOn', 'RTdsTRANALLOn', 'RTpepTRANALLOn',
+                'ratioLimOn', 'minIntensityOn', 'handSaveOn', 'handDeleteOn', 'priorFilterOn', 'idpOn', 'ldpOn']
+#the columns read by getPass, calc_tran_string/calc_prot_string and the plots; openFile(compact=True) drops the rest
+ISOTOPECOLUMNS = ['Mass Error PPM', 'Average Mass Error PPM', 'Retention Time', 'Best Retention Time', 'Fwhm',
+                  'Height', 'Max Height', 'Area', 'Background', 'Total Area', 'Total Background', 'AdjArea',
+                  'Total Area Fragment', 'Total Area MS1', 'Isotope Dot Product', 'Library Dot Product', 'Ratio Dot Product']
+MRMCOLUMNS = [FILENAMEHEADER, 'UID', 'TID', 'PID', 'Protein', 'Peptide Modified Sequence', 'Library Name', 'Library Score1',
+              'Missed Cleavages', 'PPMtranLH', 'PPMtranTRANALL', 'RTdsLH', 'RTdsTRANALL', 'RTpepTRANALL', 'ratio',
+              'handSave', 'handDelete', 'priorFilter', 'allClear', 'currentCalc', 'currentPosDataset', 'currentPosProtein', 'colOff'] + \
+             [LIGHTSTRING+c for c in ISOTOPECOLUMNS] + [HEAVYSTRING+c for c in ISOTOPECOLUMNS]
 class MasseFrame(wx.Frame):
     """ The main frame of the application
     """
@@ -70,6 +85,12 @@ class MasseFrame(wx.Frame):
 
         self.currentHist = "PPMtranLH"
         self.dataFrame = df
+        self.medianCache = masseStats.MedianCache()
+        #bumped whenever allClear or the plotted values change, see MedianCache
+        self.filterGeneration = 0
+        self.uidIndex = masseFilter.RowIndex(self.dataFrame, 'UID')
+        self.tidIndex = masseFilter.RowIndex(self.dataFrame, 'TID')
+        self.recalcScheduler = masseScheduler.RecalcScheduler(self.gatherRecalc, self.computeRecalc, self.applyRecalc)
         self.currentRow = self.dataFrame.iloc[0]
         self.currentISOFile = self.currentRow['UID']
         self.currentDataset = self.currentRow[FILENAMEHEADER]
@@ -360,12 +381,10 @@ class MasseFrame(wx.Frame):
             self.redrawAll()
    
     def pickScatterPoint(self, event):
-        ind = event.ind
-        thisline = event.artist
-        ydata = thisline.get_ydata()
-        xdata = thisline.get_xdata()
-        self.currentRow = self.datasetView[(self.datasetView['currentCalc'] == ydata[ind][0]) & \
-                                                ((self.datasetView['currentPosDataset']+self.datasetView['colOff']) == xdata[ind][0])].iloc[0]
+        rows = masseArtists.pickedRows(event)
+        if rows is None:
+            return
+        self.currentRow = self.uidIndex.row(rows['UID'].values[masseArtists.cyclePick(rows, 'UID', self.currentISOFile)])
         self.currentISOFile = self.currentRow['UID']
         self.currentProtein = self.currentRow['Protein']
         self.proteinView = self.dataFrame[self.dataFrame['Protein'] == self.currentProtein]
@@ -383,12 +402,10 @@ class MasseFrame(wx.Frame):
         self.canvasRight.draw()
     
     def pickScatterPointProtein(self, event):
-        ind = event.ind
-        thisline = event.artist
-        ydata = thisline.get_ydata()
-        xdata = thisline.get_xdata()
-        self.currentRow = self.proteinView[(self.proteinView['currentCalc'] == ydata[ind][0]) & \
-                                                ((self.proteinView['currentPosProtein']+self.proteinView['colOff']) == xdata[ind][0])].iloc[0]
+        rows = masseArtists.pickedRows(event)
+        if rows is None:
+            return
+        self.currentRow = self.uidIndex.row(rows['UID'].values[masseArtists.cyclePick(rows, 'UID', self.currentISOFile)])
         self.currentISOFile = self.currentRow['UID']
         self.currentDataset = self.currentRow[FILENAMEHEADER]
         
@@ -404,7 +421,7 @@ class MasseFrame(wx.Frame):
         self.canvasRight.draw()        
         
     def newPepSelection(self):
-        self.currentRow = self.dataFrame[self.dataFrame['UID'] == self.currentISOFile].iloc[0]
+        self.currentRow = self.uidIndex.row(self.currentISOFile)
         self.currentISOFile = self.currentRow['UID']
         self.currentProtein = self.currentRow['Protein']
         self.proteinView = self.dataFrame[self.dataFrame['Protein'] == self.currentProtein]
@@ -420,8 +437,8 @@ class MasseFrame(wx.Frame):
         event.Skip()
         c = event.GetKeyCode()
         if c is 68: #got a d keystroke
-            self.dataFrame.loc[self.dataFrame['UID'] == self.currentISOFile,'handDelete'] = True
-            self.dataFrame.loc[self.dataFrame['UID'] == self.currentISOFile,'handSave'] = False
+            self.uidIndex.setValue(self.currentISOFile, 'handDelete', True)
+            self.uidIndex.setValue(self.currentISOFile, 'handSave', False)
             try:            
                 myIndex = list(self.savedListItems).index(self.currentISOFile)
             except ValueError:
@@ -434,13 +451,13 @@ class MasseFrame(wx.Frame):
             self.recalcAndDrawAll()
             
         elif c is 83: # got a s keystroke
-            self.dataFrame.loc[self.dataFrame['UID'] == self.currentISOFile,'handDelete'] = False
-            self.dataFrame.loc[self.dataFrame['UID'] == self.currentISOFile,'handSave'] = True
+            self.uidIndex.setValue(self.currentISOFile, 'handDelete', False)
+            self.uidIndex.setValue(self.currentISOFile, 'handSave', True)
             self.recalcAndDrawAll()
             
         elif c is 69:
-            self.dataFrame.loc[self.dataFrame['TID'] == self.currentRow['TID'], 'handDelete'] = True
-            self.dataFrame.loc[self.dataFrame['TID'] == self.currentRow['TID'], 'handSave'] = False
+            self.tidIndex.setValue(self.currentRow['TID'], 'handDelete', True)
+            self.tidIndex.setValue(self.currentRow['TID'], 'handSave', False)
             try:
                 myIndex = list(self.savedListItems).index(self.currentISOFile)
             except ValueError:
@@ -453,8 +470,8 @@ class MasseFrame(wx.Frame):
             self.recalcAndDrawAll()
             
         elif c is 87:
-            self.dataFrame.loc[self.dataFrame['TID'] == self.currentRow['TID'], 'handDelete'] = False
-            self.dataFrame.loc[self.dataFrame['TID'] == self.currentRow['TID'], 'handSave'] = True
+            self.tidIndex.setValue(self.currentRow['TID'], 'handDelete', False)
+            self.tidIndex.setValue(self.currentRow['TID'], 'handSave', True)
             self.recalcAndDrawAll()
 
     def calc_lists(self):
@@ -470,7 +487,23 @@ class MasseFrame(wx.Frame):
         self.datasetsList.SetStringSelection(self.currentDataset)
 
     def recalcAndDrawAll(self, setZero=False):
-        self.calc_data()
+        self.recalcScheduler.runNow()
+
+    def gatherRecalc(self):
+        return [self.getChecksNum(), self.getChecksDen(), self.getFilterChecks(), self.findRanges()]
+
+    def computeRecalc(self, inputs):
+        [calcNum, calcDen, checks, ranges] = inputs
+        currentCalc = mrmTools.calcValue(self.dataFrame, calcNum, calcDen)
+        allClear = self.getPass(checks, ranges) | self.dataFrame['handSave']
+        return [calcNum, calcDen, currentCalc, allClear]
+
+    def applyRecalc(self, result):
+        [self.calcNum, self.calcDen, currentCalc, allClear] = result
+        self.dataFrame['currentCalc'] = currentCalc
+        self.dataFrame['allClear'] = allClear
+        self.filterGeneration += 1
+        self.calc_views()
         self.calc_hist()
         self.calc_figureLeft()
         self.calc_figureRight()
@@ -482,67 +515,71 @@ class MasseFrame(wx.Frame):
         self.calc_lists()
         self.draw_all()
 
-    def calc_data(self):
-        self.calcNum = self.getChecksNum()
-        self.calcDen = self.getChecksDen()
-        self.dataFrame['currentCalc'] = mrmTools.calcValue(self.dataFrame, self.calcNum, self.calcDen)
-        self.filterData()
-        self.currentRow = self.dataFrame[self.dataFrame['UID'] == self.currentISOFile].iloc[0]
+    def calc_views(self):
+        self.currentRow = self.uidIndex.row(self.currentISOFile)
         self.currentISOFile = self.currentRow['UID']
         self.currentProtein = self.currentRow['Protein']        
         self.currentDataset = self.currentRow[FILENAMEHEADER]
         self.datasetView = self.dataFrame[self.dataFrame[FILENAMEHEADER] == self.currentDataset]
         self.proteinView = self.dataFrame[self.dataFrame['Protein'] == self.currentRow['Protein']]
                
-    def filterData(self):
-        self.findRanges()
-        self.dataFrame['allClear'] = self.getPass() | self.dataFrame['handSave']
-    
-    def findRanges(self):    
-        self.PPMtranLH = float(self.PPMtranLHRangeBypass.GetValue())
-        self.PPMtranTRANALL = float(self.PPMtranTRANALLRangeBypass.GetValue())
-        (self.PPMdsL_low, self.PPMdsL_high) = map(float, self.PPMdsLRangeBypass.GetValue().split(' '))
-        (self.PPMdsH_low, self.PPMdsH_high) = map(float, self.PPMdsHRangeBypass.GetValue().split(' '))
-        self.RTdsLH = float(self.RTdsLHRangeBypass.GetValue())
-        self.RTdsTRANALL = float(self.RTdsTRANALLRangeBypass.GetValue())
-        self.RTpepTRANALL = float(self.RTpepTRANALLRangeBypass.GetValue())
-        (self.ratio_low, self.ratio_high) = map(float, self.ratioLimBypass.GetValue().split(' '))
-        self.minIntensity = map(float, self.minIntensityBypass.GetValue().split(' '))
-        self.idp = float(self.idpRangeBypass.GetValue())
-        self.ldp = float(self.ldpRangeBypass.GetValue())
-
-    def getPass(self):
-        self.findRanges()
-        filt = self.dataFrame['Missed Cleavages'] >= -1     
-        if self.PPMtranLHOn.IsChecked():
-            filt =  filt & (self.dataFrame['PPMtranLH'] <= self.PPMtranLH)
-        if self.PPMtranTRANALLOn.IsChecked():
-            filt =  filt & (self.dataFrame['PPMtranTRANALL'] <= self.PPMtranTRANALL)
-        if self.PPMdsLOn.IsChecked():
-            filt = filt & (self.dataFrame[LIGHTSTRING+'Mass Error PPM'] >= self.PPMdsL_low) & (self.dataFrame[LIGHTSTRING+'Mass Error PPM'] <= self.PPMdsL_high)
-        if self.PPMdsHOn.IsChecked():
-            filt = filt & (self.dataFrame[HEAVYSTRING+'Mass Error PPM'] >= self.PPMdsH_low) & (self.dataFrame[HEAVYSTRING+'Mass Error PPM'] <= self.PPMdsH_high)
-        if self.RTdsLHOn.IsChecked():
-            filt = filt & (self.dataFrame['RTdsLH'] <= self.RTdsLH)
-        if self.RTdsTRANALLOn.IsChecked():
-            filt = filt & (self.dataFrame['RTdsTRANALL'] <= self.RTdsTRANALL)
-        if self.RTpepTRANALLOn.IsChecked():
-           filt = filt & (self.dataFrame['RTpepTRANALL'] <= self.RTpepTRANALL)
-        if self.ratioLimOn.IsChecked():
-            filt = filt & (self.dataFrame['ratio'] >= self.ratio_low) & (self.dataFrame['ratio'] <= self.ratio_high)
-        if self.minIntensityOn.IsChecked():
-            filt = filt & (self.dataFrame[LIGHTSTRING+'AdjArea'] >= self.minIntensity[0]) & (self.dataFrame[HEAVYSTRING+'AdjArea'] >= self.minIntensity[1])
-        if self.handSaveOn.IsChecked():
-            filt = filt | (self.dataFrame['handSave'] == True)
-        if self.handDeleteOn.IsChecked():
-            filt = filt & (self.dataFrame['handDelete'] == False)
-        if self.priorFilterOn.IsChecked():
-            filt = filt & (self.dataFrame['priorFilter'] == True)
-        if self.idpOn.IsChecked():
-            filt = filt & (self.dataFrame[LIGHTSTRING+'Isotope Dot Product'] >= self.idp) & (self.dataFrame[HEAVYSTRING+'Isotope Dot Product'] >= self.idp)
-        if self.ldpOn.IsChecked():
-            filt = filt & (self.dataFrame[LIGHTSTRING+'Library Dot Product'] >= self.ldp) & (self.dataFrame[HEAVYSTRING+'Library Dot Product'] >= self.ldp)
-        return filt
+    def findRanges(self):
+        #parsed on the UI thread and handed to getPass, which may run on the recalc worker
+        ranges = {}
+        ranges['PPMtranLH'] = float(self.PPMtranLHRangeBypass.GetValue())
+        ranges['PPMtranTRANALL'] = float(self.PPMtranTRANALLRangeBypass.GetValue())
+        ranges['PPMdsL'] = map(float, self.PPMdsLRangeBypass.GetValue().split(' '))
+        ranges['PPMdsH'] = map(float, self.PPMdsHRangeBypass.GetValue().split(' '))
+        ranges['RTdsLH'] = float(self.RTdsLHRangeBypass.GetValue())
+        ranges['RTdsTRANALL'] = float(self.RTdsTRANALLRangeBypass.GetValue())
+        ranges['RTpepTRANALL'] = float(self.RTpepTRANALLRangeBypass.GetValue())
+        ranges['ratio'] = map(float, self.ratioLimBypass.GetValue().split(' '))
+        ranges['minIntensity'] = map(float, self.minIntensityBypass.GetValue().split(' '))
+        ranges['idp'] = float(self.idpRangeBypass.GetValue())
+        ranges['ldp'] = float(self.ldpRangeBypass.GetValue())
+        return ranges
+
+    def getFilterChecks(self):
+        return dict((name, getattr(self, name).IsChecked()) for name in FILTERCHECKS)
+
+    def getPass(self, checks=None, ranges=None):
+        if checks is None:
+            checks = self.getFilterChecks()
+        if ranges is None:
+            ranges = self.findRanges()
+        steps = [('and', 'Missed Cleavages', -1, numpy.inf)]
+        if checks['PPMtranLHOn']:
+            steps.append(('and', 'PPMtranLH', -numpy.inf, ranges['PPMtranLH']))
+        if checks['PPMtranTRANALLOn']:
+            steps.append(('and', 'PPMtranTRANALL', -numpy.inf, ranges['PPMtranTRANALL']))
+        if checks['PPMdsLOn']:
+            steps.append(('and', LIGHTSTRING+'Mass Error PPM', ranges['PPMdsL'][0], ranges['PPMdsL'][1]))
+        if checks['PPMdsHOn']:
+            steps.append(('and', HEAVYSTRING+'Mass Error PPM', ranges['PPMdsH'][0], ranges['PPMdsH'][1]))
+        if checks['RTdsLHOn']:
+            steps.append(('and', 'RTdsLH', -numpy.inf, ranges['RTdsLH']))
+        if checks['RTdsTRANALLOn']:
+            steps.append(('and', 'RTdsTRANALL', -numpy.inf, ranges['RTdsTRANALL']))
+        if checks['RTpepTRANALLOn']:
+            steps.append(('and', 'RTpepTRANALL', -numpy.inf, ranges['RTpepTRANALL']))
+        if checks['ratioLimOn']:
+            steps.append(('and', 'ratio', ranges['ratio'][0], ranges['ratio'][1]))
+        if checks['minIntensityOn']:
+            steps.append(('and', LIGHTSTRING+'AdjArea', ranges['minIntensity'][0], numpy.inf))
+            steps.append(('and', HEAVYSTRING+'AdjArea', ranges['minIntensity'][1], numpy.inf))
+        if checks['handSaveOn']:
+            steps.append(('or', 'handSave', 1, 1))
+        if checks['handDeleteOn']:
+            steps.append(('and', 'handDelete', 0, 0))
+        if checks['priorFilterOn']:
+            steps.append(('and', 'priorFilter', 1, 1))
+        if checks['idpOn']:
+            steps.append(('and', LIGHTSTRING+'Isotope Dot Product', ranges['idp'], numpy.inf))
+            steps.append(('and', HEAVYSTRING+'Isotope Dot Product', ranges['idp'], numpy.inf))
+        if checks['ldpOn']:
+            steps.append(('and', LIGHTSTRING+'Library Dot Product', ranges['ldp'], numpy.inf))
+            steps.append(('and', HEAVYSTRING+'Library Dot Product', ranges['ldp'], numpy.inf))
+        return pd.Series(masseFilter.fusedMask(self.dataFrame, steps), index=self.dataFrame.index)
         
     def calc_figureLeft(self):
         s = ':'
@@ -554,21 +591,21 @@ class MasseFrame(wx.Frame):
         for c in list(self.passDatasetView['colOff'].unique()):
             color = COLORMAP(c)
             toPlot = self.passDatasetView[self.passDatasetView['colOff'] == c]
-            self.byDatasetPlot.plot(toPlot['currentPosDataset']+toPlot['colOff'], toPlot['currentCalc'], 'o', 
-                                       color=color, picker=5, mec='none', alpha=1, ms=5*self.size)
+            masseArtists.tagRows(self.byDatasetPlot.plot(toPlot['currentPosDataset']+toPlot['colOff'], toPlot['currentCalc'], 'o', 
+                                       color=color, picker=5, mec='none', alpha=1, ms=5*self.size)[0], toPlot)
         self.byDatasetPlot.plot([-1], [-1], 'o', color='red', label='Saved: ' + str(self.passDatasetView.shape[0]), visible=False)
         self.byDatasetPlot.grid(self.cb_grid.IsChecked())
         self.selectedPointDataset, = self.byDatasetPlot.plot(self.currentRow['currentPosDataset'] + self.currentRow['colOff'], self.currentRow['currentCalc'], 
                                               'o', ms=30*self.size, alpha=0.5, color='yellow')
         
-        meds = self.determineMedians(self.passDatasetView, 'currentPosDataset')
+        meds = self.determineMedians(self.passDatasetView, 'currentPosDataset', self.currentDataset)
         self.byDatasetPlot.plot(meds[0], meds[1], 'g-', lw=2, label="Median : " + str(round(numpy.median(meds[1]),1)))
         
         if not self.hideCheck.IsChecked():
             mec = 'grey'
             mark = 'x'
-            self.byDatasetPlot.plot(self.failDatasetView['currentPosDataset']+self.failDatasetView['colOff'], self.failDatasetView['currentCalc'], mark, 
-                                    mec=mec, picker=5, label="Filtered : " + str(self.failDatasetView.shape[0]), color = 'grey')
+            masseArtists.tagRows(self.byDatasetPlot.plot(self.failDatasetView['currentPosDataset']+self.failDatasetView['colOff'], self.failDatasetView['currentCalc'], mark, 
+                                    mec=mec, picker=5, label="Filtered : " + str(self.failDatasetView.shape[0]), color = 'grey')[0], self.failDatasetView)
 
         self.byDatasetPlot.set_xticks(range(1,int(self.datasetView['currentPosDataset'].max())+1))
         self.byDatasetPlot.set_xticklabels(self.positionLabelsDataset, rotation=90, size='small')
@@ -605,8 +642,8 @@ class MasseFrame(wx.Frame):
         for c in list(self.passProteinView['colOff'].unique()):
             color = COLORMAP(c)
             toPlot = self.passProteinView[self.passProteinView['colOff'] == c]
-            self.byProteinPlot.plot(toPlot['currentPosProtein']+toPlot['colOff'], toPlot['currentCalc'], 'o', 
-                                       color=color, picker=5, mec='none', alpha=1, ms=5*self.size)
+            masseArtists.tagRows(self.byProteinPlot.plot(toPlot['currentPosProtein']+toPlot['colOff'], toPlot['currentCalc'], 'o', 
+                                       color=color, picker=5, mec='none', alpha=1, ms=5*self.size)[0], toPlot)
 
         theRows = self.proteinView[self.proteinView['TID'] == self.currentRow['TID']]
         self.selectedPointsProtein, = self.byProteinPlot.plot(theRows['currentPosProtein'] + theRows['colOff'], theRows['currentCalc'], 
@@ -615,14 +652,14 @@ class MasseFrame(wx.Frame):
         
         self.byProteinPlot.grid(self.cb_grid.IsChecked())
 
-        meds = self.determineMedians(self.passProteinView, 'currentPosProtein')
+        meds = self.determineMedians(self.passProteinView, 'currentPosProtein', self.currentProtein)
         self.byProteinPlot.plot(meds[0], meds[1], 'g-', lw=2, label="Median : " + str(round(numpy.median(meds[1]),1)))
         
         if not (self.hideCheck.IsChecked()):
             mec = 'grey'
             mark = 'x'
-            self.byProteinPlot.plot(self.failProteinView['currentPosProtein']+self.failProteinView['colOff'], self.failProteinView['currentCalc'], mark, 
-                                    mec=mec, picker=5, label="Filtered : " + str(self.failProteinView.shape[0]), color = 'grey')
+            masseArtists.tagRows(self.byProteinPlot.plot(self.failProteinView['currentPosProtein']+self.failProteinView['colOff'], self.failProteinView['currentCalc'], mark, 
+                                    mec=mec, picker=5, label="Filtered : " + str(self.failProteinView.shape[0]), color = 'grey')[0], self.failProteinView)
                                     
         self.byProteinPlot.set_xticks(range(1,int(self.proteinView['currentPosProtein'].max())+1))
         self.byProteinPlot.set_xticklabels(self.positionLabelsProtein, rotation=90, size='small')
@@ -645,11 +682,8 @@ class MasseFrame(wx.Frame):
         self.canvasLeft.draw()
         self.canvasRight.draw()   
     
-    def determineMedians(self, view, field):
-        xs = list(set(view[field]))
-        ys = [view[view[field]==k]['currentCalc'].median() for k in xs]
-        xs = [float(i)+0.5 for i in xs]
-        return [xs,ys]
+    def determineMedians(self, view, field, name):
+        return self.medianCache.get(view, field, (self.filterGeneration, name), offset=0.5)
         
     def getChecksNum(self):
         toReturn = []        
@@ -806,66 +840,66 @@ class MasseFrame(wx.Frame):
             
     def on_PPMtranLH_range_button(self, event):
         self.currentHist = "PPMtranLH"
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_PPMtranTRANALL_range_button(self, event):
         self.currentHist = "PPMtranTRANALL"
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_PPMdsL_range_button(self, event):
         self.currentHist = LIGHTSTRING + 'Mass Error PPM'
-        self.recalcAndDrawAll()        
+        self.recalcScheduler.request()        
     def on_PPMdsH_range_button(self, event):
         self.currentHist = HEAVYSTRING + 'Mass Error PPM'
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_RTdsLH_range_button(self, event):
         self.currentHist = "RTdsLH"
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_RTdsTRANALL_range_button(self, event):
         self.currentHist = "RTdsTRANALL"
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_RTpepTRANALL_range_button(self, event):
         self.currentHist = "RTpepTRANALL"
-        self.recalcAndDrawAll()    
+        self.recalcScheduler.request()    
     def on_minIntensity_range_button(self, event):
         self.currentHist = HEAVYSTRING+'AdjArea'
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_ratio_range_button(self, event):
         self.currentHist = "ratio"
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_idp_range_button(self, event):
         self.currentHist = HEAVYSTRING + 'Isotope Dot Product'
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_ldp_range_button(self, event):
         self.currentHist = HEAVYSTRING + 'Library Dot Product'
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
 
     def on_PPMtranLHOn(self, event):
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_PPMtranTRANALLOn(self, event):
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_PPMdsLOn(self, event):
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_PPMdsHOn(self, event):
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_RTdsLHOn(self, event):
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_RTdsTRANALLOn(self, event):
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_RTpepTRANALLOn(self, event):
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_minIntensityOn(self, event):
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_ratioLimOn(self, event):
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_handSaveOn(self, event):
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_handDeleteOn(self, event):
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_priorFilterOn(self, event):
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_idpOn(self, event):
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_ldpOn(self, event):
-        self.recalcAndDrawAll()
+        self.recalcScheduler.request()
     def on_exit(self, event):
         self.Destroy()
 ###############################################
@@ -878,7 +912,12 @@ def setCurrentFrac(calcNum, calcDen):
     den = [i.strip() for i in calcDen]
     return string.join(num, "+") + "/" + string.join(den, "+")
     
-def openFile(fullpath):
+def openFile(fullpath, compact=False):
+    """
+    compact keeps only MRMCOLUMNS, with the filter measures as float32 and
+    the label columns as categoricals (see compactFrame.py); exports then only
+    contain those columns.
+    """
     r = csv.reader(open(fullpath))
     header = r.next()
     
@@ -886,6 +925,8 @@ def openFile(fullpath):
         print "incorrect csv file"
     else:
         dataFrame = mrmTools.readMRMCSV(fullpath, fileNameHeader = FILENAMEHEADER)
+        if compact:
+            compactFrame.compactLoaded(dataFrame, keep=MRMCOLUMNS)
     return dataFrame
 
 def startApp(dataFrame,fn, fsize=None, size=None):
@@ -904,7 +945,7 @@ def startApp(dataFrame,fn, fsize=None, size=None):
     app.frame.Show()
     app.MainLoop()    
 
-def fileOpenStart(pathToFile=None):
+def fileOpenStart(pathToFile=None, compact=False):
         """
         Create and show the Open FileDialog
         """
@@ -926,7 +967,7 @@ def fileOpenStart(pathToFile=None):
         dp = '/'.join(hold.split('/')[:-1])+'/'
         fn = hold.split('/')[-1]
         print "opening file : " + pathToFile + "..."
-        df = openFile(pathToFile)
+        df = openFile(pathToFile, compact=compact)
         return [df, fn]
         frame.Destroy()
         app.Destroy()
@@ -941,7 +982,9 @@ if __name__ == '__main__':
     #size=1.0
     fsize=None
     size=None
+    #compact=True keeps only the columns the viewer uses, for exports too big to open otherwise
+    compact=False
     #pathToFile = '/home/jhdavis/Dropbox/fromLinux/test_full_new.csv'
     
-    [dfr, fn] = fileOpenStart(pathToFile)
+    [dfr, fn] = fileOpenStart(pathToFile, compact=compact)
     startApp(dfr, fn, fsize=fsize, size=size)
\ No newline at end of file
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Debounced recalculation for the masse viewers. Filter widgets call request();
+requests arriving within delay ms of each other are coalesced into a single
+recalculation, which is computed on a worker thread and applied back on the
+UI thread. Only the result of the latest request is ever applied.
+"""
+
+import wx
+import threading
+
+RECALCDELAY = 150
+
+class RecalcScheduler(object):
+    """
+    gather() runs on the UI thread and reads whatever the computation needs
+    from the widgets, compute(inputs) runs on the worker thread and must not
+    touch wx or write to shared state, and apply(result) runs on the UI thread.
+    compute and apply always run with lock held, so they never overlap each
+    other or a synchronous runNow.
+    """
+    def __init__(self, gather, compute, apply, delay=RECALCDELAY):
+        self.gather = gather
+        self.compute = compute
+        self.apply = apply
+        self.delay = delay
+        self.timer = None
+        self.generation = 0
+        self.pending = None
+        self.lock = threading.RLock()
+        self.busy = False
+        self.condition = threading.Condition()
+        self.delivered = threading.Event()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def request(self):
+        if self.timer is not None and self.timer.IsRunning():
+            self.timer.Restart(self.delay)
+        else:
+            self.timer = wx.CallLater(self.delay, self.start)
+
+    def cancel(self):
+        if self.timer is not None:
+            self.timer.Stop()
+        with self.condition:
+            self.generation += 1
+            self.pending = None
+            self.busy = False
+
+    def start(self):
+        inputs = self.gather()
+        with self.condition:
+            self.generation += 1
+            self.pending = (self.generation, inputs)
+            self.busy = True
+            self.condition.notify()
+
+    def flush(self, *args):
+        """
+        Runs a scheduled or in flight recalculation now, so the data can be
+        edited without a stale result landing on top of the edit.
+        """
+        if self.busy or (self.timer is not None and self.timer.IsRunning()):
+            self.runNow(*args)
+
+    def runNow(self, *args):
+        """
+        Cancels anything scheduled or in flight and recalculates synchronously;
+        args are passed on to apply.
+        """
+        self.cancel()
+        inputs = self.gather()
+        with self.lock:
+            self.apply(self.compute(inputs), *args)
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending is None:
+                    self.condition.wait()
+                (generation, inputs) = self.pending
+                self.pending = None
+            with self.lock:
+                if generation != self.generation:
+                    #superseded while waiting for the lock
+                    continue
+                try:
+                    result = self.compute(inputs)
+                except Exception as e:
+                    print 'recalculation failed : ' + str(e)
+                    self.busy = False
+                    continue
+            self.delivered.clear()
+            wx.CallAfter(self.deliver, generation, result)
+            #don't start on the next request until this one has been applied (or dropped)
+            self.delivered.wait()
+
+    def deliver(self, generation, result):
+        try:
+            if generation == self.generation:
+                self.busy = False
+                with self.lock:
+                    self.apply(result)
+        finally:
+            self.delivered.set()
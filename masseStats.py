@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Summary statistics shared by the masse viewers.
+"""
+
+import os
+import collections
+import numpy
+import pandas
+
+def groupedMedians(view, field, value='currentCalc', offset=0.0):
+    """
+    Median of value at each position in field, in a single groupby pass.
+    Returns [xs, ys] sorted by position, xs as floats shifted by offset.
+    """
+    meds = view.groupby(field)[value].median()
+    xs = [float(i)+offset for i in meds.index]
+    ys = list(meds.values)
+    return [xs, ys]
+
+class MedianCache(object):
+    """
+    groupedMedians keyed on the filter state the passing view was cut with,
+    so the median line is only recomputed when the filters (or the values
+    plotted) change, not on every redraw. state is any hashable the viewer
+    changes whenever it refilters, recalculates or moves points; the view's
+    contents are never read on a hit. Keeps the last maxEntries results.
+    """
+    def __init__(self, maxEntries=16):
+        self.maxEntries = maxEntries
+        self.medians = collections.OrderedDict()
+
+    def get(self, view, field, state, value='currentCalc', offset=0.0):
+        key = (field, value, offset, state)
+        if key in self.medians:
+            self.medians[key] = self.medians.pop(key)
+        else:
+            self.medians[key] = groupedMedians(view, field, value=value, offset=offset)
+            while len(self.medians) > self.maxEntries:
+                self.medians.popitem(last=False)
+        return self.medians[key]
+
+#statistics groupedSummary can compute for each cell
+SUMMARYSTATS = ['median', 'count', 'mad', 'iqr']
+
+def codedQuantiles(values, codes, ngroups, qs):
+    """
+    Quantiles (linearly interpolated, as Series.quantile) of the non NaN
+    values in each of ngroups groups, from a single sort. codes are as from
+    pandas.factorize; rows coded -1 are ignored. Returns one array per q,
+    NaN for empty groups.
+    """
+    valid = ~numpy.isnan(values) & (codes >= 0)
+    order = numpy.lexsort((values[valid], codes[valid]))
+    sortedValues = values[valid][order]
+    counts = numpy.bincount(codes[valid], minlength=ngroups)
+    starts = numpy.cumsum(counts) - counts
+    full = counts > 0
+    (counts, starts) = (counts[full], starts[full])
+    quantiles = []
+    for q in qs:
+        position = (counts-1)*q
+        low = numpy.floor(position).astype(numpy.int64)
+        high = numpy.minimum(low+1, counts-1)
+        lowValues = sortedValues[starts+low]
+        quantile = numpy.empty(ngroups)
+        quantile.fill(numpy.nan)
+        quantile[full] = lowValues + (position-low)*(sortedValues[starts+high]-lowValues)
+        quantiles.append(quantile)
+    return quantiles
+
+def groupedQuantiles(dataFrame, fields, value, qs):
+    """
+    Per group quantiles of value (see codedQuantiles), as
+    groupby().quantile() runs a python function per group. Returns one
+    Series per q, indexed by the observed field values.
+    """
+    values = dataFrame[value].values.astype(float)
+    codes = numpy.zeros(len(dataFrame), dtype=numpy.int64)
+    levels = []
+    for field in fields:
+        (fieldCodes, uniques) = pandas.factorize(dataFrame[field])
+        codes = codes*len(uniques) + fieldCodes
+        levels.append((fieldCodes, uniques))
+    valid = ~numpy.isnan(values)
+    for (fieldCodes, uniques) in levels:
+        valid &= fieldCodes >= 0
+    #renumber the observed groups 0..n-1
+    (groups, first, groupCodes) = numpy.unique(codes[valid], return_index=True, return_inverse=True)
+    codes = numpy.empty(len(dataFrame), dtype=numpy.int64)
+    codes.fill(-1)
+    codes[valid] = groupCodes
+    first = numpy.flatnonzero(valid)[first]
+    index = pandas.MultiIndex.from_arrays([uniques.take(fieldCodes[first]) for (fieldCodes, uniques) in levels], names=fields)
+    return [pandas.Series(q, index=index) for q in codedQuantiles(values, codes, len(groups), qs)]
+
+def groupedSummary(dataFrame, rowField, colField, value='currentCalc', stats=['median'], rows=None, cols=None):
+    """
+    rowField x colField tables of the given stats of value, from one groupby
+    pass over dataFrame (mad is the unscaled median absolute deviation from
+    the cell median, iqr the 75th minus the 25th percentile). Returns
+    {stat:table}; rows/cols fix the order of the table's index/columns, and
+    cells without data are NaN (0 for count).
+    """
+    grouped = dataFrame.groupby([rowField, colField])[value]
+    cells = {}
+    for stat in stats:
+        if stat == 'median':
+            cells[stat] = grouped.median()
+        elif stat == 'count':
+            cells[stat] = grouped.count()
+        elif stat == 'mad':
+            deviation = (dataFrame[value] - grouped.transform('median')).abs()
+            cells[stat] = deviation.groupby([dataFrame[rowField], dataFrame[colField]]).median()
+        elif stat == 'iqr':
+            [q25, q75] = groupedQuantiles(dataFrame, [rowField, colField], value, [0.25, 0.75])
+            cells[stat] = q75 - q25
+        else:
+            raise ValueError('unknown summary statistic ' + str(stat))
+    tables = {}
+    for stat in stats:
+        table = cells[stat].unstack(colField)
+        if rows is not None:
+            table = table.reindex(index=rows)
+        if cols is not None:
+            table = table.reindex(columns=cols)
+        if stat == 'count':
+            table = table.fillna(0).astype(int)
+        tables[stat] = table
+    return tables
+
+def writeSummaryTables(tables, path, fileFormat='csv'):
+    """
+    Writes the median table of a groupedSummary to path and any other stat
+    next to it as <path>_<stat>. fileFormat is 'csv' or 'parquet' (which
+    needs pyarrow or fastparquet; falls back to csv without them). Returns
+    the paths written.
+    """
+    (base, ext) = os.path.splitext(path)
+    written = []
+    for stat in sorted(tables.keys(), key=lambda s: s != 'median'):
+        table = tables[stat]
+        statPath = base if stat == 'median' else base + '_' + stat
+        if fileFormat == 'parquet':
+            try:
+                table = table.copy()
+                table.columns = [str(c) for c in table.columns]
+                table.reset_index().to_parquet(statPath + '.parquet')
+                written.append(statPath + '.parquet')
+                continue
+            except ImportError as e:
+                print 'writing ' + stat + ' as csv : ' + str(e)
+        #same layout as the old per cell loop wrote: unnamed index and columns
+        table.rename_axis(None).rename_axis(None, axis=1).to_csv(statPath + (ext or '.csv'))
+        written.append(statPath + (ext or '.csv'))
+    return written
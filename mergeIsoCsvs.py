@@ -10,12 +10,44 @@ import qMS
 import numpy
 import scipy
 import sys
+import time
+import argparse
+import itertools
+import collections
+import multiprocessing
+import multiprocessing.pool
 
 
 def readFileListing(fileListString):
     fileList = [i.rstrip().split(',') for i in open(fileListString).readlines()]
     return fileList
 
+def truncatedKey(series):
+    """
+    Same strings as series.map(str).str.split('.').str[0] for the numeric key
+    columns, but built by integer truncation instead of formatting every float.
+    str() rounds to 12 significant digits first, so values close enough below
+    an integer to round up to it (2.9999999999999996 -> '3'), and values it
+    would print in exponent form (or nan/inf), still go through str() so the
+    keys match exactly.
+    """
+    if numpy.issubdtype(series.dtype, numpy.integer):
+        return series.astype(str)
+    values = numpy.asarray(series, dtype=float)
+    finite = numpy.isfinite(values)
+    finiteValues = numpy.where(finite, values, 0)
+    magnitude = numpy.abs(finiteValues)
+    #generous bound on how far below the next integer str()'s rounding can reach
+    gap = numpy.ceil(magnitude) - magnitude
+    roundsUp = (gap > 0) & (gap < 1e-11*magnitude)
+    simple = finite & (magnitude >= 1e-4) & (magnitude < 1e11) & ~roundsUp
+    keys = numpy.empty(len(values), dtype=object)
+    keys[simple] = numpy.trunc(values[simple]).astype(numpy.int64).astype(str)
+    keys[simple & (finiteValues < 0) & (finiteValues > -1)] = '-0'
+    #float(), as str() of a numpy float64 prints all 17 digits
+    keys[~simple] = [str(float(v)).split('.')[0] for v in values[~simple]]
+    return pandas.Series(keys, index=series.index)
+
 def readSingleIsoCSV(path, shortName=None):
     dataset = qMS.readIsoCSV(path)
     if shortName is None:
@@ -23,29 +55,103 @@ def readSingleIsoCSV(path, shortName=None):
     dataset['shortName'] = shortName
 
     s = '_'
-    dataset['UID'] =  dataset['originFile'] +s+ dataset['protein'] +s+ dataset['startres'].map(str).str.split('.').str[0] +s+\
-                        dataset['endres'].map(str).str.split('.').str[0] +s+ dataset['mw'].map(str).str.split('.').str[0] +s+ \
-                        dataset['charge'].map(str).str.split('.').str[0] +s+ dataset['rt_n14'].map(str).str.split('.').str[0]
-    dataset['TID'] =  dataset['protein'] +s+ dataset['startres'].map(str).str.split('.').str[0] +s+\
-                        dataset['endres'].map(str).str.split('.').str[0] +s+ dataset['mw'].map(str).str.split('.').str[0] +s+ \
-                        dataset['charge'].map(str).str.split('.').str[0]
+    tid = dataset['protein'] +s+ truncatedKey(dataset['startres']) +s+ truncatedKey(dataset['endres']) +s+ \
+            truncatedKey(dataset['mw']) +s+ truncatedKey(dataset['charge'])
+    dataset['UID'] =  dataset['originFile'] +s+ tid +s+ truncatedKey(dataset['rt_n14'])
+    dataset['TID'] =  tid
     return dataset
 
-if __name__ == '__main__':
-    if len(sys.argv) > 1:
-        fileListString=sys.argv[1]
+def readTimedIsoCSV(f):
+    start = time.time()
+    dataset = readSingleIsoCSV(f[0], shortName=f[1])
+    return [dataset, time.time()-start]
+
+def boundedImap(pool, func, items, window):
+    """
+    Ordered pool.imap that keeps at most window items submitted but not yet
+    handed on, so a slow consumer doesn't pile up results.
+    """
+    pending = collections.deque()
+    for item in items:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while len(pending) > 0:
+        yield pending.popleft().get()
+
+def readIsoCSVs(fileList, workers=1, processes=False, bounded=False):
+    """
+    Generator over the datasets in fileList, in file-listing order. With
+    workers > 1 the files are read concurrently by a thread pool (or a process
+    pool if processes=True), each worker starting on the next file as soon as
+    it is free. bounded=True holds at most 2*workers datasets read ahead of
+    the consumer; otherwise every file is read as fast as the pool allows.
+    workers < 1 uses every core.
+    """
+    if workers < 1:
+        workers = multiprocessing.cpu_count()
+    if workers > 1 and processes:
+        pool = multiprocessing.Pool(workers)
+    elif workers > 1:
+        pool = multiprocessing.pool.ThreadPool(workers)
     else:
-        fileListString='/home/jhdavis/data/emDeps/emrSet/testFileList.txt'
+        pool = None
 
-    if len(sys.argv) > 2:
-        outputFileString=sys.argv[2]
+    if pool is None:
+        results = itertools.imap(readTimedIsoCSV, fileList)
+    elif bounded:
+        results = boundedImap(pool, readTimedIsoCSV, fileList, 2*workers)
     else:
-        outputFileString='/home/jhdavis/data/emDeps/emrSet/testOutput_mergedCSV.csv'
-        
-    fileList = readFileListing(fileListString)
-    
-    fullDataset = pandas.DataFrame()
-    for f in fileList:
-        sn = f[1]
-        fullDataset = fullDataset.append(readSingleIsoCSV(f[0], shortName=sn), ignore_index=True)
-    fullDataset.to_csv(outputFileString, index=False)
\ No newline at end of file
+        results = pool.imap(readTimedIsoCSV, fileList)
+    for (f, [dataset, elapsed]) in itertools.izip(fileList, results):
+        print 'read ' + f[0] + ' in ' + str(round(elapsed,2)) + 's'
+        sys.stdout.flush()
+        yield dataset
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+def mergeIsoCSVs(fileList, outputFileString, stream=False, workers=1, processes=False):
+    """
+    Merges the (path, shortName) pairs in fileList into one csv. By default the
+    datasets are concatenated once at the end; with stream=True each dataset is
+    appended to the output as soon as it is read, so only one input (or two per
+    worker) is held in memory at a time. Streamed datasets are written with the columns of the
+    first dataset. workers/processes are passed on to readIsoCSVs.
+    """
+    datasets = readIsoCSVs(fileList, workers=workers, processes=processes, bounded=stream)
+    if not stream:
+        datasets = list(datasets)
+        if len(datasets) > 0:
+            fullDataset = pandas.concat(datasets, ignore_index=True)
+        else:
+            fullDataset = pandas.DataFrame()
+        fullDataset.to_csv(outputFileString, index=False)
+        return
+
+    columns = None
+    for (i, dataset) in enumerate(datasets):
+        if columns is None:
+            columns = list(dataset.columns)
+            dataset.to_csv(outputFileString, index=False)
+        else:
+            extra = [c for c in dataset.columns if not c in columns]
+            if len(extra) > 0:
+                print 'warning : dropping columns not in the first dataset from ' + fileList[i][0] + ' : ' + ', '.join(extra)
+            dataset.reindex(columns=columns).to_csv(outputFileString, index=False, header=False, mode='a')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='merge the _iso.csv files in a file listing into a single csv')
+    parser.add_argument('fileListString', nargs='?', default='/home/jhdavis/data/emDeps/emrSet/testFileList.txt')
+    parser.add_argument('outputFileString', nargs='?', default='/home/jhdavis/data/emDeps/emrSet/testOutput_mergedCSV.csv')
+    parser.add_argument('-s', '--stream', action='store_true',
+                        help='write each dataset as it is read (peak memory ~ 2 x jobs x largest single input)')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of files to read concurrently (0 uses every core)')
+    parser.add_argument('-p', '--processes', action='store_true',
+                        help='read with a process pool instead of threads')
+    args = parser.parse_args()
+
+    fileList = readFileListing(args.fileListString)
+    mergeIsoCSVs(fileList, args.outputFileString, stream=args.stream, workers=args.jobs, processes=args.processes)
@@ -6,13 +6,140 @@ Created on Sun Jun  8 10:25:03 2014
 """
 
 import qMS
+import os
+import csv
 import glob
 import sys
+import time
+import hashlib
+import argparse
+import traceback
+import multiprocessing
 import pandas as pd
 pd.options.mode.chained_assignment = None
-processDirectory = str(sys.argv[1])
-listToProcess=glob.glob(processDirectory+'/*_iso.csv')
-for f in listToProcess:
-    print 'processing' + f
-    sys.stdout.flush()
-    qMS.preProcessIsoCSV(f, True)
+
+MANIFESTNAME = 'preprocess.manifest'
+#bump this if the preProcessIsoCSV call below changes so stale outputs are redone
+PREPROCESSPARAMS = 'preProcessIsoCSV(True)'
+
+def resultPath(f):
+    return f[:-4]+'_res.csv'
+
+def hashFile(f, blockSize=2**20):
+    h = hashlib.sha1()
+    inFile = open(f, 'rb')
+    block = inFile.read(blockSize)
+    while len(block) > 0:
+        h.update(block)
+        block = inFile.read(blockSize)
+    inFile.close()
+    return [f, h.hexdigest()]
+
+def hashFiles(listToHash, processes=1):
+    if processes > 1:
+        pool = multiprocessing.Pool(processes)
+        hashes = pool.map(hashFile, listToHash)
+        pool.close()
+        pool.join()
+    else:
+        hashes = map(hashFile, listToHash)
+    return dict(hashes)
+
+def readManifest(path):
+    """
+    Returns {file name : [sha1, params]} for every file preprocessed so far;
+    empty if there is no manifest yet.
+    """
+    manifest = {}
+    if not os.path.exists(path):
+        return manifest
+    f = open(path, 'r')
+    r = csv.reader(f)
+    r.next()
+    for l in r:
+        manifest[l[0]] = [l[1], l[2]]
+    f.close()
+    return manifest
+
+def writeManifest(path, manifest):
+    f = open(path, 'w')
+    w = csv.writer(f)
+    w.writerow(['file', 'sha1', 'params'])
+    for k in sorted(manifest.keys()):
+        w.writerow([k] + manifest[k])
+    f.close()
+
+def isUpToDate(f, digest, manifest, params=PREPROCESSPARAMS):
+    return manifest.get(os.path.basename(f)) == [digest, params] and os.path.exists(resultPath(f))
+
+def preProcessFile(f):
+    """
+    Worker for a single _iso.csv; returns [file, passed, seconds, error message]
+    instead of the dataFrame so nothing large is sent back from the pool.
+    """
+    start = time.time()
+    try:
+        qMS.preProcessIsoCSV(f, True)
+        return [f, True, time.time()-start, '']
+    except Exception:
+        return [f, False, time.time()-start, traceback.format_exc()]
+
+def preProcessFiles(listToProcess, processes=1):
+    if processes > 1:
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap_unordered(preProcessFile, listToProcess)
+    else:
+        pool = None
+        results = (preProcessFile(f) for f in listToProcess)
+
+    processed = []
+    failed = []
+    start = time.time()
+    for (i, [f, passed, elapsed, err]) in enumerate(results):
+        if passed:
+            processed.append(f)
+            print '[' + str(i+1) + '/' + str(len(listToProcess)) + '] processed ' + f + ' (' + str(round(elapsed,1)) + 's)'
+        else:
+            print '[' + str(i+1) + '/' + str(len(listToProcess)) + '] FAILED ' + f
+            print err
+            failed.append(f)
+        sys.stdout.flush()
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    print 'processed ' + str(len(listToProcess)-len(failed)) + ' of ' + str(len(listToProcess)) + ' files in ' + \
+            str(round(time.time()-start,1)) + 's using ' + str(processes) + ' process(es)'
+    if len(failed) > 0:
+        print 'failed files : \n\t' + '\n\t'.join(failed)
+    return [processed, failed]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='preprocess all *_iso.csv files in a directory')
+    parser.add_argument('processDirectory')
+    parser.add_argument('-p', '--processes', type=int, default=1,
+                        help='number of worker processes (0 uses every core)')
+    parser.add_argument('-f', '--force', action='store_true',
+                        help='reprocess every file, even those unchanged since the last run')
+    args = parser.parse_args()
+
+    processes = args.processes
+    if processes < 1:
+        processes = multiprocessing.cpu_count()
+    allFiles = glob.glob(str(args.processDirectory)+'/*_iso.csv')
+    manifestPath = os.path.join(str(args.processDirectory), MANIFESTNAME)
+    manifest = readManifest(manifestPath)
+    hashes = hashFiles(allFiles, processes=processes)
+    if args.force:
+        listToProcess = allFiles
+    else:
+        listToProcess = [f for f in allFiles if not isUpToDate(f, hashes[f], manifest)]
+        print 'skipping ' + str(len(allFiles)-len(listToProcess)) + ' unchanged file(s)'
+
+    [processed, failed] = preProcessFiles(listToProcess, processes=processes)
+    for f in processed:
+        manifest[os.path.basename(f)] = [hashes[f], PREPROCESSPARAMS]
+    for f in failed:
+        manifest.pop(os.path.basename(f), None)
+    writeManifest(manifestPath, manifest)
+    sys.exit(len(failed) > 0)
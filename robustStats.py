@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Robust centre and spread of the filter columns, for suggesting filter
+ranges: the median and the MAD (scaled to a normal sigma) or standard
+deviation with outliers iteratively clipped, so a tail of bad fits doesn't
+widen the ranges. Everything works on numpy arrays, per group or per column.
+"""
+
+import numpy
+import pandas
+import masseStats
+
+#MAD of a normal distribution times MADSCALE is its sigma
+MADSCALE = 1.4826
+#values further than CLIPSIGMA sigmas from the median are dropped before the next iteration
+CLIPSIGMA = 3.0
+CLIPITERATIONS = 5
+
+def codedMedians(values, codes, ngroups):
+    """
+    Median of the non NaN values in each group (see masseStats.codedQuantiles).
+    """
+    return masseStats.codedQuantiles(values, codes, ngroups, [0.5])[0]
+
+def groupedSpreads(values, codes, ngroups, medians, spread='mad'):
+    """
+    Spread of the non NaN values in each group: MADSCALE*MAD around medians
+    for 'mad', the sample standard deviation for 'std'.
+    """
+    if spread == 'mad':
+        return MADSCALE*codedMedians(numpy.abs(values - medians[codes]), codes, ngroups)
+    elif spread == 'std':
+        valid = ~numpy.isnan(values) & (codes >= 0)
+        counts = numpy.bincount(codes[valid], minlength=ngroups).astype(float)
+        means = numpy.bincount(codes[valid], weights=values[valid], minlength=ngroups)/counts
+        squares = numpy.bincount(codes[valid], weights=(values[valid] - means[codes[valid]])**2, minlength=ngroups)
+        return numpy.sqrt(squares/(counts-1))
+    raise ValueError('unknown spread ' + str(spread))
+
+def groupedClippedStats(values, codes, ngroups, clip=CLIPSIGMA, iterations=CLIPITERATIONS, spread='mad'):
+    """
+    Clipped median and spread (see groupedSpreads) of values in every group
+    at once. Each iteration drops the values more than clip spreads from
+    their group's median; stops as soon as an iteration drops nothing.
+    Returns [medians, spreads, iterations run].
+    """
+    values = numpy.array(values, dtype=float)
+    for i in range(iterations):
+        medians = codedMedians(values, codes, ngroups)
+        spreads = groupedSpreads(values, codes, ngroups, medians, spread)
+        outliers = numpy.abs(values - medians[codes]) > clip*spreads[codes]
+        if not outliers.any():
+            return [medians, spreads, i]
+        values[outliers] = numpy.nan
+    medians = codedMedians(values, codes, ngroups)
+    return [medians, groupedSpreads(values, codes, ngroups, medians, spread), iterations]
+
+def clippedStats(values, clip=CLIPSIGMA, iterations=CLIPITERATIONS, spread='mad'):
+    """
+    groupedClippedStats for a single array: [median, spread, iterations run].
+    """
+    values = numpy.asarray(values, dtype=float)
+    [medians, spreads, n] = groupedClippedStats(values, numpy.zeros(len(values), dtype=numpy.int64), 1,
+                                                clip=clip, iterations=iterations, spread=spread)
+    return [medians[0], spreads[0], n]
+
+def columnStats(dataFrame, cols, clip=CLIPSIGMA, iterations=CLIPITERATIONS, spread='mad'):
+    """
+    clippedStats of each of cols, as {col:(median, spread)}.
+    """
+    stats = {}
+    for col in cols:
+        [median, colSpread, n] = clippedStats(dataFrame[col].values, clip=clip, iterations=iterations, spread=spread)
+        stats[col] = (median, colSpread)
+    return stats
+
+def groupedRanges(dataFrame, groupField, cols, width, logCols=[], clip=CLIPSIGMA, iterations=CLIPITERATIONS):
+    """
+    median +- width clipped sigmas of each of cols in each group of groupField,
+    as {group:{col:(low, high)}}. Columns in logCols are clipped on a log10
+    scale and their ranges transformed back. Groups with no spread to go on
+    (a single row, all values equal or all NaN) get (NaN, NaN) rather than a
+    zero width range.
+    """
+    (codes, groups) = pandas.factorize(dataFrame[groupField])
+    ranges = dict((g, {}) for g in groups)
+    for col in cols:
+        values = dataFrame[col].values.astype(float)
+        if col in logCols:
+            values = numpy.log10(numpy.where(values > 0, values, numpy.nan))
+        [medians, sigmas, n] = groupedClippedStats(values, codes, len(groups), clip=clip, iterations=iterations)
+        sigmas = numpy.where(sigmas > 0, sigmas, numpy.nan)
+        [lows, highs] = [medians - width*sigmas, medians + width*sigmas]
+        if col in logCols:
+            [lows, highs] = [10**lows, 10**highs]
+        for (i, g) in enumerate(groups):
+            ranges[g][col] = (lows[i], highs[i])
+    return ranges